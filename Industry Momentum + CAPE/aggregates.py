@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.datastore import DataStore
+from common.security_master import SecurityMaster, convert_symbols
+from common.trading_calendar import TradingCalendar
+
+from membership import MembershipIndex
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+LEVELS = ('I', 'II')
+TABLES = ('prices', 'earnings', 'dividends', 'total_returns')
+# constituent-level sources, their value column and how the records of a ticker fold within a quarter
+SOURCES = {'dividends': ('div_per_share', 'sum'), 'earnings': ('NPAP', 'last')}
+# inputs every quarter depends on, any change to them recomputes all quarters
+REFERENCE = ('WIND_I_index_comp', 'WIND_II_index_comp', 'WIND_I_map')
+# raw constituent-level WIND exports, too large for the repository and read from source_dir
+PANELS = ('price', 'market_cap')
+
+
+def weighted_sums(codes, n, mcap, values) -> np.ndarray:
+    '''market cap weighted sums of a per-ticker value for each of n industries'''
+    valid = (codes >= 0) & ~np.isnan(mcap) & ~np.isnan(values)
+    return np.bincount(codes[valid], (mcap * values)[valid], minlength=n)
+
+
+class IndustryAggregator():
+    '''folds constituent-level dividends and earnings into the quarterly industry tables
+
+    Records are streamed from dividends.csv and earnings.csv in chunks and folded into
+    per-ticker quarterly state, the dividends per share announced in each quarter and the
+    last net profit announced in each quarter. Each output row is the first trading day of
+    a quarter and reads the state of the quarter before it, weighting the point-in-time
+    constituents by market cap and scaling to the index level as data_preprocessing.ipynb
+    did, for both WIND levels at once.
+
+    The sources are treated as append-only, so an update reads only the records added
+    since the last one and recomputes only the quarters they touch.
+
+    The constituent-level inputs are the raw WIND exports data_preprocessing.ipynb read:
+    price.csv and market_cap.csv (date x ticker panels), dividends.csv (ticker, announced,
+    div_per_share) and earnings.csv (ticker, announced, NPAP). They are not all kept in the
+    repository, so source_dir points at wherever they were exported to. The industry
+    tables, compositions, maps and CPI are read from data_dir, where the output goes.
+    '''
+
+    def __init__(self, data_dir=DATA_DIR, source_dir=None, state_dir=None, start='2000-02-01', chunk_size=10000) -> None:
+        self.data_dir = data_dir
+        self.source_dir = source_dir or data_dir
+        self.state_dir = state_dir or os.path.join(data_dir, '.aggregates')
+        self.start = pd.to_datetime(start)
+        self.chunk_size = chunk_size
+        missing = [name + '.csv' for name in PANELS + tuple(SOURCES) if not os.path.exists(self.source_path(name))]
+        if missing:
+            raise FileNotFoundError(f'{missing} not found in {self.source_dir}, pass the directory of the WIND exports as source_dir')
+        self.store = DataStore(data_dir)
+        self.sources = DataStore(self.source_dir)
+        self.securities = SecurityMaster()
+        self.membership = {level: MembershipIndex.from_wind(level, data_dir, self.securities) for level in LEVELS}
+        self.manifest = self.load_manifest()
+        self.state = {name: self.load_state(name) for name in SOURCES}
+        self.n_rows = {}
+        self.days = None
+
+    def source_path(self, name) -> str:
+        return os.path.join(self.source_dir, name + '.csv')
+
+    def table_path(self, table, level) -> str:
+        return os.path.join(self.data_dir, f'quarterly_{table}_{level}.csv')
+
+    def load_manifest(self) -> dict:
+        path = os.path.join(self.state_dir, 'manifest.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def load_state(self, name) -> pd.DataFrame:
+        '''folded records of a source, indexed by (ticker, quarter)'''
+        path = os.path.join(self.state_dir, name + '.csv')
+        if not self.manifest or not os.path.exists(path):
+            index = pd.MultiIndex.from_arrays([[], pd.PeriodIndex([], freq='Q')], names=['ticker', 'quarter'])
+            return pd.DataFrame({'announced': pd.Series(dtype='datetime64[ns]'), 'value': pd.Series(dtype=float)}, index=index)
+        df = pd.read_csv(path, dtype={'ticker': str}, parse_dates=['announced'])
+        df['quarter'] = pd.PeriodIndex(df['quarter'], freq='Q')
+        return df.set_index(['ticker', 'quarter'])
+
+    def get_reference(self) -> dict:
+        return {name: self.store.fingerprint(name) for name in REFERENCE}
+
+    def is_stale(self) -> bool:
+        '''whether the stored state cannot be extended and everything must be rebuilt'''
+        if not self.manifest:
+            return True
+        if self.manifest['start'] != str(self.start.date()) or self.manifest['reference'] != self.get_reference():
+            return True
+        # rows consumed from one export mean nothing in another
+        if self.manifest.get('source_dir') != os.path.abspath(self.source_dir):
+            return True
+        if not all(os.path.exists(self.table_path(table, level)) for level in LEVELS for table in TABLES):
+            return True
+        # a source that shrank was rewritten rather than appended to
+        return any(os.path.getsize(self.source_path(name)) < self.manifest['sources'][name]['size'] for name in SOURCES)
+
+    def reset(self) -> None:
+        self.manifest = {}
+        self.state = {name: self.load_state(name) for name in SOURCES}
+
+    def read_new(self, name):
+        '''chunks of the records appended to a source since the last update'''
+        consumed = self.manifest['sources'][name]['rows'] if self.manifest else 0
+        return pd.read_csv(self.source_path(name), dtype=str, encoding='utf-8-sig', chunksize=self.chunk_size,
+                           skiprows=range(1, consumed+1))
+
+    def parse_chunk(self, chunk, column) -> pd.DataFrame:
+        announced = pd.to_datetime(chunk['announced'], errors='coerce')
+        value = pd.to_numeric(chunk[column], errors='coerce')
+        keep = announced.notna() & value.notna()
+        return pd.DataFrame({
+            'ticker': np.asarray(convert_symbols(chunk['ticker'][keep].str.zfill(6), 'wind')),
+            'quarter': announced[keep].dt.to_period('Q'),
+            'announced': announced[keep],
+            'value': value[keep],
+        })
+
+    def fold(self, name, records) -> None:
+        how = SOURCES[name][1]
+        combined = pd.concat([self.state[name].reset_index(), records], ignore_index=True)
+        if how == 'sum':
+            folded = combined.groupby(['ticker', 'quarter']).agg({'announced': 'max', 'value': 'sum'})
+        else:
+            # the latest announcement of a quarter wins, later records break ties
+            combined = combined.sort_values('announced', kind='stable')
+            folded = combined.groupby(['ticker', 'quarter']).last()
+        self.state[name] = folded.sort_index()
+
+    def stream(self, name) -> pd.MultiIndex:
+        '''folds the new records of a source chunk by chunk, returns the (ticker, quarter) keys they touched'''
+        column = SOURCES[name][0]
+        keys, n_rows = [], 0
+        for chunk in self.read_new(name):
+            n_rows += len(chunk)
+            records = self.parse_chunk(chunk, column)
+            self.fold(name, records)
+            keys.append(records[['ticker', 'quarter']])
+        self.n_rows[name] = n_rows
+        if not keys:
+            return pd.MultiIndex.from_arrays([[], pd.PeriodIndex([], freq='Q')], names=['ticker', 'quarter'])
+        return pd.MultiIndex.from_frame(pd.concat(keys)).unique()
+
+    def get_cpi(self) -> pd.Series:
+        cpi = self.store.load('cpi', index_col='Date')['CPI']
+        return pd.Series(cpi.values, index=cpi.index.to_period('Q'))
+
+    def get_quarter_days(self) -> pd.DatetimeIndex:
+        '''the first trading day of every quarter from the start date on, as far as CPI is published'''
+        days = TradingCalendar(self.sources.load('price').index).get_period_firsts('Q')
+        quarters = days.to_period('Q')
+        return days[(quarters.start_time >= self.start) & quarters.isin(self.get_cpi().index)]
+
+    def get_touched(self, quarters, name, keys) -> np.ndarray:
+        '''whether the row of each quarter reads any of the folded keys'''
+        touched = np.zeros(len(quarters) + 1, dtype=np.int64)
+        if not len(keys):
+            return touched[:-1] > 0
+        ordinals = quarters.asi8
+        # a quarter's records first show up in the row of the next quarter
+        first = (keys.get_level_values('quarter') + 1).asi8
+        if SOURCES[name][1] == 'sum':
+            last = first
+        else:
+            # the last announcement is read until the ticker's next announced quarter takes over
+            state = self.state[name].index
+            following = pd.Series(state.get_level_values('quarter').asi8, index=state).groupby(level='ticker').shift(-1)
+            last = following.reindex(keys).fillna(ordinals[-1]).values.astype(np.int64)
+        np.add.at(touched, np.searchsorted(ordinals, first, side='left'), 1)
+        np.add.at(touched, np.searchsorted(ordinals, last, side='right'), -1)
+        return np.cumsum(touched)[:-1] > 0
+
+    def get_wide(self, name, quarters, tickers) -> pd.DataFrame:
+        '''the folded value every ticker carries into each quarter from the quarter before it'''
+        values = self.state[name]['value'].unstack('ticker').reindex(columns=tickers)
+        if SOURCES[name][1] == 'sum':
+            return values.reindex(quarters - 1).fillna(0)
+        if values.empty:
+            return values.reindex(quarters - 1)
+        # announcements carry forward over the quarters without one
+        span = pd.period_range(min(values.index.min(), quarters.min() - 1), quarters.max(), freq='Q')
+        return values.reindex(span).ffill().reindex(quarters - 1)
+
+    def compute(self, days) -> dict:
+        '''the rows of all four tables of both levels on the given quarter days'''
+        quarters = days.to_period('Q')
+        df_price = self.sources.load('price')
+        tickers = df_price.columns
+        price = df_price.loc[days].values
+        mcap = self.sources.load('market_cap').loc[days].reindex(columns=tickers).values
+        dividends = self.get_wide('dividends', quarters, tickers).values
+        # net profit per share, with the share count implied by market cap over price
+        eps = self.get_wide('earnings', quarters, tickers).values * price / mcap
+
+        cpi = self.get_cpi()
+        cpi = (cpi / cpi.loc[self.get_quarter_days()[0].to_period('Q')]).reindex(quarters).values[:, None]
+
+        tables = {}
+        for level in LEVELS:
+            df_idx = self.store.load(f'WIND_{level}_industry_index', index_col='Date')
+            n = len(df_idx.columns)
+            membership = self.membership[level]
+            # positions of the membership industries among the index columns
+            remap = np.append(df_idx.columns.get_indexer(membership.industries), -1)
+            codes = remap[membership.get_codes(tickers.values[None, :], days.values[:, None])]
+
+            level_values = df_idx.reindex(days).values
+            out = {table: np.full((len(days), n), np.nan) for table in TABLES}
+            for i in range(len(days)):
+                total = weighted_sums(codes[i], n, mcap[i], price[i])
+                # converts market cap weighted per-share values into index points
+                scale = level_values[i] / np.where(total != 0, total, np.nan)
+                out['dividends'][i] = weighted_sums(codes[i], n, mcap[i], dividends[i]) * scale
+                out['earnings'][i] = weighted_sums(codes[i], n, mcap[i], eps[i]) * scale
+            out['prices'] = level_values
+            out['dividends'] = np.nan_to_num(out['dividends'])
+            out['total_returns'] = out['prices'] + out['dividends']
+            out['earnings'] = out['earnings'] * out['total_returns'] / out['prices']
+
+            # all tables are in real terms, relative to the first quarter
+            tables[level] = {table: pd.DataFrame(values / cpi, index=pd.DatetimeIndex(days, name='Date'), columns=df_idx.columns)
+                             for table, values in out.items()}
+        return tables
+
+    def write_tables(self, tables, days) -> None:
+        for level in LEVELS:
+            for table in TABLES:
+                path = self.table_path(table, level)
+                rows = tables[level][table]
+                if self.manifest and os.path.exists(path):
+                    df = pd.read_csv(path, index_col=['Date'], parse_dates=['Date'], encoding='utf-8-sig')
+                    rows = pd.concat([df.drop(index=rows.index, errors='ignore'), rows])
+                rows = rows[rows.index.isin(days)].sort_index()
+                rows.to_csv(path, index_label='Date')
+
+    def save(self) -> None:
+        '''writes the state and the manifest together, so a run is either fully recorded or not at all'''
+        tmp = self.state_dir + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in SOURCES:
+            df = self.state[name].reset_index()
+            df['quarter'] = df['quarter'].astype(str)
+            df.to_csv(os.path.join(tmp, name + '.csv'), index=False)
+
+        consumed = self.manifest.get('sources', {})
+        self.manifest = {
+            'start': str(self.start.date()),
+            'source_dir': os.path.abspath(self.source_dir),
+            'reference': self.get_reference(),
+            'sources': {name: {'rows': consumed.get(name, {}).get('rows', 0) + self.n_rows[name],
+                               'size': os.path.getsize(self.source_path(name))} for name in SOURCES},
+            'days': [str(day.date()) for day in self.days],
+        }
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+        os.replace(tmp, self.state_dir)
+
+    def update(self, rebuild=False) -> pd.DatetimeIndex:
+        '''folds the new records into the state and rewrites the quarters they touch, returns their days'''
+        if rebuild or self.is_stale():
+            self.reset()
+        self.n_rows = {}
+        keys = {name: self.stream(name) for name in SOURCES}
+
+        self.days = self.get_quarter_days()
+        quarters = self.days.to_period('Q')
+        # quarters not written before are new, everything is new after a reset
+        touched = ~self.days.isin(pd.DatetimeIndex(self.manifest.get('days', [])))
+        for name in SOURCES:
+            touched |= self.get_touched(quarters, name, keys[name])
+
+        days = self.days[touched]
+        if len(days):
+            self.write_tables(self.compute(days), self.days)
+        self.save()
+        return days
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='updates the quarterly WIND I and II industry tables from constituent-level data')
+    parser.add_argument('--source-dir', default=None, help='directory of price, market_cap, dividends and earnings.csv, defaults to data/')
+    parser.add_argument('--start', default='2000-02-01')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--rebuild', action='store_true', help='recompute every quarter from scratch')
+    args = parser.parse_args()
+
+    t_begin = time.time()
+    aggregator = IndustryAggregator(source_dir=args.source_dir, start=args.start, chunk_size=args.chunk_size)
+    days = aggregator.update(rebuild=args.rebuild)
+    print(f'[Updating...] {len(days)} quarters recomputed in {round(time.time()-t_begin, 2)} seconds.')
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ranking import rank_within
+
+
+def winsorize_window(values, limits=0.05) -> np.ndarray:
+    '''winsorizes one window as scipy.stats.mstats.winsorize does on a plain array, NaN included'''
+    values = np.array(values, dtype=float)
+    n = len(values)
+    k = int(limits * n)
+    # NaN sorts last, so it counts as the largest values
+    idx = np.argsort(values)
+    values[idx[:k]] = values[idx[k]]
+    values[idx[n-k:]] = values[idx[n-k-1]]
+    return values
+
+
+def get_relative_cape_scalar(capes, limits=0.05) -> float:
+    '''the relative Shiller-CAPE ratio of one window of CAPE values, the reference for the panel'''
+    capes = winsorize_window(capes, limits)
+    return capes[-1] / np.mean(capes)
+
+
+class CapePanel():
+    '''computes CAPE, relative CAPE and their ranks for all industries and all periods at once
+
+    Columns keyed by (level, industry) hold several WIND levels side by side, each
+    industry is then ranked among the peers of its own level.
+    '''
+
+    def __init__(self, earnings, total_returns, n_quarter=20, limits=0.05) -> None:
+        self.earnings = earnings
+        self.total_returns = total_returns
+        self.n_quarter = n_quarter
+        self.limits = limits
+        self.periods = total_returns.index
+        self._cape = None
+        self._relative_cape = {}
+        self._rank = {}
+
+    def get_cape(self) -> pd.DataFrame:
+        '''the absolute (i.e. raw) Shiller-CAPE ratio of every industry in every period'''
+        if self._cape is None:
+            # average earnings over the last n quarters, NaN until n quarters are available
+            earnings = self.earnings.rolling(self.n_quarter, min_periods=1).mean()
+            earnings.iloc[:self.n_quarter-1] = np.nan
+            earnings = earnings.reindex(self.periods, method='ffill')
+            self._cape = self.total_returns / earnings
+        return self._cape
+
+    def get_relative_cape(self, n_period=40) -> pd.DataFrame:
+        '''the relative Shiller-CAPE ratio of every industry in every period'''
+        if n_period not in self._relative_cape:
+            cape = self.get_cape()
+            relative_cape = pd.DataFrame(np.nan, index=cape.index, columns=cape.columns)
+
+            if len(cape) >= n_period:
+                # (periods, industries, n_period) view of every trailing window
+                windows = sliding_window_view(cape.values, n_period, axis=0)
+                # winsorize each window the same way scipy.stats.mstats.winsorize does
+                k = int(self.limits * n_period)
+                ordered = np.sort(windows, axis=-1)
+                lower = ordered[..., k:k+1]
+                upper = ordered[..., n_period-k-1:n_period-k]
+                winsorized = np.clip(windows, lower, upper)
+                # NaN sorts above every value, so up to k of them take the upper value, more leave it NaN
+                winsorized = np.where(np.isnan(windows), upper, winsorized)
+
+                values = winsorized[..., -1] / winsorized.mean(axis=-1)
+                relative_cape.iloc[n_period-1:] = values
+
+            self._relative_cape[n_period] = relative_cape
+        return self._relative_cape[n_period]
+
+    def get_relative_cape_rank(self, n_period=40) -> pd.DataFrame:
+        '''the numeric rank of every industry's relative Shiller-CAPE ratio among peers in every period'''
+        if n_period not in self._rank:
+            relative_cape = self.get_relative_cape(n_period).fillna(99)
+            self._rank[n_period] = rank_within(relative_cape, method='first').astype(int)
+        return self._rank[n_period]
+
+    def get_row(self, panel, date, n_period=40) -> pd.Series:
+        '''looks up the most recent row of a panel on or before a date'''
+        idx = self.periods.searchsorted(date, side='right')
+        if idx < self.n_quarter:
+            raise Exception('Insufficient data, need at least 5 years (20 quarters) to calculate CAPE')
+        if idx < n_period + self.n_quarter - 1:
+            raise Exception('Insufficient data, need at least 10 years to calculate Relative CAPE')
+        return panel.iloc[idx-1]
+
+
+if __name__ == '__main__':
+    # checks the panel against the scalar path, with industries whose early CAPE is missing
+    rng = np.random.default_rng(0)
+    periods = pd.date_range('2000-01-01', periods=80, freq='QS')
+    total_returns = pd.DataFrame(np.exp(np.cumsum(rng.normal(0.01, 0.05, (80, 4)), axis=0)), index=periods)
+    earnings = total_returns * rng.lognormal(np.log(0.05), 0.3, (80, 4))
+    earnings.iloc[:27, 1] = np.nan
+    earnings.iloc[:45, 2] = np.nan
+    panel = CapePanel(earnings, total_returns)
+    cape = panel.get_cape().values
+    for n_period in (10, 20, 40):
+        relative_cape = panel.get_relative_cape(n_period).values
+        for i in range(n_period-1, len(periods)):
+            for j in range(cape.shape[1]):
+                expected = get_relative_cape_scalar(cape[i-n_period+1:i+1, j], panel.limits)
+                assert np.isclose(relative_cape[i, j], expected, equal_nan=True), (n_period, periods[i], j)
+    print('[Checking...] Relative CAPE panel matches the scalar path.')
@@ -1,136 +1,132 @@
+import os
+import sys
+
 import numpy as np
 import pandas as pd
-from dateutil.relativedelta import relativedelta
-from scipy.stats.mstats import winsorize
-from tqdm import tqdm
 from xquant.backtest.backtest import run_backtest
 from xquant.backtest.data import Data
 from xquant.backtest.metrics import plot_performance, show_metrics
 from xquant.portfolio import Portfolio
 from xquant.strategy import Strategy
-from xquant.util import closest_trading_day
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.datastore import DataStore
+from common.profiling import profile
+from common.trading_calendar import TradingCalendar
+
+from cape import CapePanel
+from membership import read_map
+from momentum import MomentumPanel
+from ranking import CrossSectionalRanker
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+STORE = DataStore(DATA_DIR)
+
+LEVELS = ('I', 'II')
+SECTORS = {level: list(read_map(level, DATA_DIR).unique()) for level in LEVELS}
+
+
+def load_levels(name) -> pd.DataFrame:
+    '''a table of every WIND level side by side, with columns keyed by (level, industry)'''
+    tables = {level: STORE.load(name.format(level=level), index_col='Date')[SECTORS[level]] for level in LEVELS}
+    return pd.concat(tables, axis=1, names=['level', 'industry'])
+
+# both levels are loaded once and every factor panel is computed over all of them together
 data = Data(data={
-    'industry_index': pd.read_csv('Industry Momentum + CAPE\\data\\WIND_II_industry_index.csv', index_col=['Date'], parse_dates=['Date']),
-    'total_returns': pd.read_csv('Industry Momentum + CAPE\\data\\quarterly_total_returns_II.csv', index_col=['Date'], parse_dates=['Date']),
-    'earnings': pd.read_csv('Industry Momentum + CAPE\\data\\quarterly_earnings_II.csv', index_col=['Date'], parse_dates=['Date']),
-    'benchmark': pd.read_csv('Industry Momentum + CAPE\\data\\csi_300.csv', index_col=['date'], parse_dates=['date'])
+    'industry_index': load_levels('WIND_{level}_industry_index'),
+    'total_returns': load_levels('quarterly_total_returns_{level}'),
+    'earnings': load_levels('quarterly_earnings_{level}'),
+    'benchmark': STORE.load('csi_300', index_col='date')
 })
 
-SECTORS = list(data.get_data('industry_index').columns)
 PERIODS = data.get_data('total_returns').index
+# the levels are joined on their dates and a level may end before the other, so each
+# level keeps its own prices and calendar
+PRICES = {level: data.get_data('industry_index')[level].dropna(how='all') for level in LEVELS}
+CALENDARS = {level: TradingCalendar(PRICES[level].index) for level in LEVELS}
+CAPE_PANEL = CapePanel(data.get_data('earnings'), data.get_data('total_returns'))
+MOM_PANEL = MomentumPanel(data.get_data('industry_index'))
+
+RANKERS = {}
+for level in LEVELS:
+    RANKERS[level] = CrossSectionalRanker(SECTORS[level])
+    RANKERS[level].register('cape', lambda date, n_period, level=level: CAPE_PANEL.get_row(CAPE_PANEL.get_relative_cape_rank(n_period), date, n_period)[level])
+    RANKERS[level].register('momentum', lambda date, look_back, level=level: MOM_PANEL.get_mom_rank_on(date, look_back)[level])
+
+# default relative CAPE window of each factor, in quarters, the combined factor uses a short one
+N_PERIODS = {'cape': 40, 'mom': 40, 'combined': 10}
 
 class CAPE_MOM(Strategy):
 
-    def __init__(self, strategy_name) -> None:
+    def __init__(self, strategy_name, factor='mom', scheme='cap', n_top=8, look_back=6, n_period=None, level='II') -> None:
         super().__init__(strategy_name)
+        self.factor = factor
+        self.scheme = scheme
+        self.n_top = n_top
+        self.look_back = look_back
+        self.n_period = n_period if n_period is not None else N_PERIODS[factor]
+        self.level = level
+        self.sectors = SECTORS[level]
+        self.ranker = RANKERS[level]
+        self.calendar = CALENDARS[level]
+        self.verbose = True
+
+    def get_prices(self) -> pd.DataFrame:
+        '''daily index levels of the industries at the strategy's WIND level'''
+        return PRICES[self.level]
 
     def get_cape(self, industry, date) -> float:
         '''calculates the absolute (i.e. raw) Shiller-CAPE ratio of an industry'''
-        df_earnings = data.get_data('earnings')
-        df_earnings = df_earnings.loc[:date]
-        df_tot_rtns = data.get_data('total_returns')
-        df_tot_rtns = df_tot_rtns.loc[:date].tail(1)
-
-        # if there is insufficient data, raise error
-        if len(df_earnings) < 20:
-            raise Exception('Insufficient data, need at least 5 years (20 quarters) to calculate CAPE')
-        
-        df_earnings = df_earnings.tail(20)
-        earning = df_earnings.mean()[industry]
-        tot_rtn = df_tot_rtns[industry].values[0]
-        
-        cape = tot_rtn/earning
-        return cape
+        cape = CAPE_PANEL.get_row(CAPE_PANEL.get_cape(), date, n_period=1)
+        return cape[self.level][industry]
         
     def get_relative_cape(self, industry, date, n_period=40) -> float:
         '''calculates the relative Shiller-CAPE ratio of an industry'''
-        periods = PERIODS[PERIODS<=date][-n_period:]
-        if len(periods) < n_period:
-            raise Exception('Insufficient data, need at least 10 years to calculate Relative CAPE')
-
-        capes = [self.get_cape(industry, period) for period in periods]
-        capes = list(winsorize(capes, limits=[0.05,0.05]))
-        relative_cape = capes[-1] / np.mean(capes)
-
-        return relative_cape
+        rel_capes = CAPE_PANEL.get_row(CAPE_PANEL.get_relative_cape(n_period), date, n_period)
+        return rel_capes[self.level][industry]
 
     def get_relative_cape_rank(self, industry, date, n_period=40) -> float:
         '''calculates the numeric rank of an industry's relative Shiller-CAPE ratio among peers'''
-        rel_capes = [self.get_relative_cape(sector, date, n_period) for sector in SECTORS]
-        rel_capes_dict = dict(zip(SECTORS, rel_capes))
-
-        series = pd.Series(rel_capes_dict).fillna(99)
-        df = pd.DataFrame(series, columns=['rel_cape'])
-        df.sort_values(by=['rel_cape'], inplace=True)
-        df['rank'] = np.arange(1,len(df)+1)
-        
-        rank = df.at[industry, 'rank']
-        return rank
+        ranks = self.ranker.get_ranks('cape', date, n_period=n_period)
+        return ranks[industry]
 
     def get_momentum(self, industry, date, look_back=6) -> float:
         '''calculates the momentum of an industry'''
-        # select and truncate series
-        series = data.get_data('industry_index')[industry]
-        series = series[series.index <= date]
-        # calculate lagged return
-        start_date = date - relativedelta(months = look_back*2)
-        end_date = date - relativedelta(months = look_back)
-
-        returns = []
-        while start_date < end_date:
-            local_end = start_date + relativedelta(months=look_back)
-            period = series.loc[start_date:local_end]
-
-            start_price = period.head(1)[0]
-            end_price = period.tail(1)[0]
+        momentum = MOM_PANEL.get_momentum_on(date, look_back)
+        return momentum[self.level][industry]
 
-            local_return = (end_price/start_price) - 1
-            returns.append(local_return)
-
-            start_date += relativedelta(months=1)
-
-        momentum = np.mean(returns)
-        return momentum
-
-    def get_mom_rank(self, industry, date) -> float:
+    def get_mom_rank(self, industry, date, look_back=6) -> float:
         '''calculates the numeric rank of an industry's momentum among peers'''
-        mom_list = [self.get_momentum(sector, date) for sector in SECTORS]
-        mom_dict = dict(zip(SECTORS, mom_list))
-
-        series = pd.Series(mom_dict).dropna()
-        df = pd.DataFrame(series, columns=['momentum'])
-        df.sort_values(by=['momentum'], ascending=False, inplace=True)
-        df['rank'] = np.arange(1,len(df)+1)
-        
-        rank = df.at[industry, 'rank']
-        return rank
+        ranks = self.ranker.get_ranks('momentum', date, look_back=look_back)
+        return ranks[industry]
 
     def stock_selection_cape(self, funds, date, scheme) -> Portfolio:
         if scheme == 'shiller':
-            points = [2] * len(SECTORS)
-            points_dict = dict(zip(SECTORS, points))
-            include = SECTORS
+            points = [2] * len(self.sectors)
+            points_dict = dict(zip(self.sectors, points))
+            include = self.sectors
         elif scheme == 'cap':
             include = []
         
-        for industry in tqdm(SECTORS):
-            rel_cape_rank = self.get_relative_cape_rank(industry, date, 40) # NEED TO ADJUST TO 40
+        # rank all industries once for this rebalance
+        top = self.ranker.get_top('cape', date, self.n_top, n_period=self.n_period)
+        bottom = self.ranker.get_bottom('cape', date, self.n_top, n_period=self.n_period)
+        for industry in self.sectors:
             if scheme == 'shiller':
-                    if rel_cape_rank <= 8:
+                    if industry in top:
                         points_dict[industry] += 1
-                    elif rel_cape_rank >= len(SECTORS)-8:
+                    elif industry in bottom:
                         points_dict[industry] -= 1    
             elif scheme == 'cap':
-                if rel_cape_rank <= 8:
+                if industry in top:
                     include.append(industry)
         
-        df_prices = data.get_data('industry_index')
-        prices = df_prices.loc[closest_trading_day(date, df_prices.index, 'bfill')]
+        df_prices = self.get_prices()
+        prices = df_prices.loc[self.calendar.next(date)]
         
         if scheme == 'shiller':
             total_points = sum(points_dict.values())
-            weights = [points_dict[industry]/total_points for industry in SECTORS]
+            weights = [points_dict[industry]/total_points for industry in self.sectors]
 
         elif scheme == 'cap':
             total_cap = prices[include].sum()
@@ -147,29 +143,31 @@ class CAPE_MOM(Strategy):
 
     def stock_selection_mom(self, funds, date, scheme) -> Portfolio:
         if scheme == 'shiller':
-            points = [2] * len(SECTORS)
-            points_dict = dict(zip(SECTORS, points))
-            include = SECTORS
+            points = [2] * len(self.sectors)
+            points_dict = dict(zip(self.sectors, points))
+            include = self.sectors
         elif scheme == 'cap':
             include = []
         
-        for industry in tqdm(SECTORS):
-            mom_rank = self.get_mom_rank(industry, date) # NEED TO ADJUST TO 40
+        # rank all industries once for this rebalance
+        top = self.ranker.get_top('momentum', date, self.n_top, look_back=self.look_back)
+        bottom = self.ranker.get_bottom('momentum', date, self.n_top, look_back=self.look_back)
+        for industry in self.sectors:
             if scheme == 'shiller':
-                    if mom_rank <= 8:
+                    if industry in top:
                         points_dict[industry] += 1
-                    elif mom_rank >= len(SECTORS)-8:
+                    elif industry in bottom:
                         points_dict[industry] -= 1    
             elif scheme == 'cap':
-                if mom_rank <= 8:
+                if industry in top:
                     include.append(industry)
         
-        df_prices = data.get_data('industry_index')
-        prices = df_prices.loc[closest_trading_day(date, df_prices.index, 'bfill')]
+        df_prices = self.get_prices()
+        prices = df_prices.loc[self.calendar.next(date)]
         
         if scheme == 'shiller':
             total_points = sum(points_dict.values())
-            weights = [points_dict[industry]/total_points for industry in SECTORS]
+            weights = [points_dict[industry]/total_points for industry in self.sectors]
 
         elif scheme == 'cap':
             total_cap = prices[include].sum()
@@ -186,34 +184,36 @@ class CAPE_MOM(Strategy):
 
     def stock_selection_combined(self, funds, date, scheme) -> Portfolio:
         if scheme == 'shiller':
-            points = [2] * len(SECTORS)
-            points_dict = dict(zip(SECTORS, points))
-            include = SECTORS
+            points = [2] * len(self.sectors)
+            points_dict = dict(zip(self.sectors, points))
+            include = self.sectors
 
         elif scheme == 'cap':
             include = []
 
-        for industry in tqdm(SECTORS):
-            rel_cape_rank = self.get_relative_cape_rank(industry, date, 10) # NEED TO ADJUST TO 40
-            mom_rank = self.get_mom_rank(industry, date)
+        # rank all industries once for this rebalance, each factor picks half of the cutoff
+        n_half = self.n_top // 2
+        top = self.ranker.get_top('cape', date, n_half, n_period=self.n_period) + self.ranker.get_top('momentum', date, n_half, look_back=self.look_back)
+        bottom = self.ranker.get_bottom('cape', date, n_half, n_period=self.n_period) + self.ranker.get_bottom('momentum', date, n_half, look_back=self.look_back)
+        for industry in self.sectors:
             # over/underweight sectors based on their ranks
 
             if scheme == 'shiller':
-                if rel_cape_rank <= 4 or mom_rank <= 4:
+                if industry in top:
                     points_dict[industry] += 1
-                elif rel_cape_rank >= len(SECTORS)-4 or mom_rank >= len(SECTORS)-4:
+                elif industry in bottom:
                     points_dict[industry] -= 1
             
             elif scheme == 'cap':
-                if rel_cape_rank <= 4 or mom_rank <= 4:
+                if industry in top:
                     include.append(industry)
         
-        df_prices = data.get_data('industry_index')
-        prices = df_prices.loc[closest_trading_day(date, df_prices.index, 'bfill')]
+        df_prices = self.get_prices()
+        prices = df_prices.loc[self.calendar.next(date)]
         
         if scheme == 'shiller':
             total_points = sum(points_dict.values())
-            weights = [points_dict[industry]/total_points for industry in SECTORS]
+            weights = [points_dict[industry]/total_points for industry in self.sectors]
 
         elif scheme == 'cap':
             total_cap = prices[include].sum()
@@ -228,10 +228,13 @@ class CAPE_MOM(Strategy):
 
         return portfolio
         
-    def stock_selection(self, funds, date, scheme='cap') -> Portfolio:
+    @profile('stock selection')
+    def stock_selection(self, funds, date, scheme=None) -> Portfolio:
         '''overrides the stock_selection method in the parent class'''
-        portfolio = self.stock_selection_mom(funds, date, scheme)
-        portfolio.print_portfolio()
+        select = {'cape': self.stock_selection_cape, 'mom': self.stock_selection_mom, 'combined': self.stock_selection_combined}
+        portfolio = select[self.factor](funds, date, scheme or self.scheme)
+        if self.verbose:
+            portfolio.print_portfolio()
         return portfolio
 
 if __name__ == '__main__':
@@ -240,11 +243,11 @@ if __name__ == '__main__':
     start = pd.Timestamp('20080101')
     end = pd.Timestamp('20191231')
 
-    holdings = run_backtest(start, end, data.get_data('industry_index'), cape_mom.stock_selection, 100, 3)
-    performance = holdings.generate_performance(data.get_data('industry_index'))
+    holdings = run_backtest(start, end, cape_mom.get_prices(), cape_mom.stock_selection, 100, 3)
+    performance = holdings.generate_performance(cape_mom.get_prices())
 
     benchmark = data.get_data('benchmark')['close'][start:end]
     benchmark = benchmark / benchmark[0] * 100 # normalize
 
     plot_performance(strategy=performance, benchmark=benchmark)
-    show_metrics(strategy=performance, benchmark=benchmark, holdings=holdings, df_price=data.get_data('industry_index'))
+    show_metrics(strategy=performance, benchmark=benchmark, holdings=holdings, df_price=cape_mom.get_prices())
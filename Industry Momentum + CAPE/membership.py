@@ -0,0 +1,127 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.security_master import SecurityMaster
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# days are stored as day numbers since 1970, shifted to fit below SPAN in a combined (ticker, day) key
+DAY_OFFSET = 2**31
+SPAN = 2**32
+MIN_DAY, MAX_DAY = -DAY_OFFSET, DAY_OFFSET - 1
+
+
+def read_map(level, data_dir=DATA_DIR) -> pd.Series:
+    '''names of the industries of a WIND level keyed by their codes, in the order of WIND_{level}_map.csv'''
+    df = pd.read_csv(os.path.join(data_dir, f'WIND_{level}_map.csv'), dtype=str, encoding='utf-8-sig')
+    key, value = ('key', 'value') if level == 'I' else ('Code', 'Industry')
+    return pd.Series(df[value].values, index=df[key].values)
+
+
+def to_days(dates) -> np.ndarray:
+    '''day numbers of dates, missing dates are NaT and become -1'''
+    values = pd.DatetimeIndex(np.atleast_1d(dates)).values.astype('datetime64[D]')
+    return np.where(np.isnat(values), -1, values.astype(np.int64))
+
+
+class MembershipIndex():
+    '''point-in-time industry membership as sorted interval arrays
+
+    Each record makes a ticker a member of an industry from its included date to its
+    excluded date, both inclusive. A missing excluded date means the ticker is still a
+    member and a missing included date means it was a member before the records begin.
+    Intervals are sorted by start within each industry for constituent lookups, and by
+    (ticker, start) for industry lookups, so both are binary searches.
+    '''
+
+    def __init__(self, tickers, industries, included, excluded, securities=None) -> None:
+        self.securities = securities or SecurityMaster()
+        ids = self.securities.add(tickers)
+        included, excluded = pd.DatetimeIndex(included), pd.DatetimeIndex(excluded)
+        starts = np.where(included.isna(), MIN_DAY, to_days(included))
+        ends = np.where(excluded.isna(), MAX_DAY, to_days(excluded))
+
+        self.industries = pd.Index(pd.unique(np.asarray(industries, dtype=object)))
+        codes = self.industries.get_indexer(industries)
+
+        # intervals of each industry, one contiguous run per industry sorted by start
+        order = np.lexsort((starts, codes))
+        self._ids = ids[order]
+        self._starts = starts[order]
+        self._ends = ends[order]
+        self._bounds = np.searchsorted(codes[order], np.arange(len(self.industries) + 1))
+
+        # intervals of each ticker, keyed by ticker and start in one sorted array
+        order = np.lexsort((starts, ids))
+        self._keys = ids[order] * SPAN + (starts[order] + DAY_OFFSET)
+        self._key_ids = ids[order]
+        self._key_ends = ends[order]
+        self._key_codes = codes[order]
+
+    @classmethod
+    def from_wind(cls, level='II', data_dir=DATA_DIR, securities=None):
+        '''reads WIND_I_index_comp.csv or WIND_II_index_comp.csv, naming industries as the index tables do'''
+        df = pd.read_csv(os.path.join(data_dir, f'WIND_{level}_index_comp.csv'), dtype=str, encoding='utf-8-sig')
+        if level == 'I':
+            # level I records carry sector codes, named in WIND_I_map.csv
+            df['industry'] = df['industry'].map(read_map(level, data_dir))
+        dates = lambda col: pd.to_datetime(df[col], format='%Y%m%d', errors='coerce')
+        return cls(df['ticker'], df['industry'], dates('included'), dates('excluded'), securities)
+
+    def get_intervals(self, industry):
+        '''ticker IDs, start days and end days of all the intervals of an industry'''
+        code = self.industries.get_loc(industry)
+        run = slice(self._bounds[code], self._bounds[code+1])
+        return self._ids[run], self._starts[run], self._ends[run]
+
+    def get_constituents(self, industry, date) -> pd.Index:
+        '''tickers of an industry as of a date'''
+        ids, starts, ends = self.get_intervals(industry)
+        day = to_days(date)[0]
+        # only the intervals started by the date can hold it
+        n = np.searchsorted(starts, day, side='right')
+        return self.securities.to_wind(np.sort(ids[:n][ends[:n] >= day]))
+
+    def get_membership(self, industry, dates) -> pd.DataFrame:
+        '''a dates x tickers table of whether each ticker was in an industry on each date'''
+        ids, starts, ends = self.get_intervals(industry)
+        dates = pd.DatetimeIndex(dates)
+        days = to_days(dates)
+        tickers, cols = np.unique(ids, return_inverse=True)
+        # each interval covers a run of dates, marked by its first and one past its last position
+        first = np.searchsorted(days, starts, side='left')
+        last = np.searchsorted(days, ends, side='right')
+        marks = np.zeros((len(days) + 1, len(tickers)), dtype=np.int64)
+        np.add.at(marks, (first, cols), 1)
+        np.add.at(marks, (last, cols), -1)
+        return pd.DataFrame(np.cumsum(marks, axis=0)[:-1] > 0, index=dates, columns=self.securities.to_wind(tickers))
+
+    def get_codes(self, tickers, dates) -> np.ndarray:
+        '''positions in self.industries of the industry of each ticker on each date, -1 for none
+
+        tickers and dates broadcast against each other as NumPy arrays do.
+        '''
+        ids = self.securities.get_ids(np.ravel(tickers)).reshape(np.shape(tickers))
+        days = to_days(np.ravel(dates)).reshape(np.shape(dates))
+        ids, days = np.broadcast_arrays(ids, days)
+        # the last interval of the ticker started on or before the day
+        pos = np.searchsorted(self._keys, ids * SPAN + (days + DAY_OFFSET), side='right') - 1
+        found = np.clip(pos, 0, None)
+        valid = (ids >= 0) & (pos >= 0) & (self._key_ids[found] == ids) & (self._key_ends[found] >= days)
+        return np.where(valid, self._key_codes[found], -1)
+
+    def get_industry(self, ticker, date):
+        '''the industry of a ticker as of a date, NaN if it was in none'''
+        code = self.get_codes(np.array([ticker]), np.array([pd.to_datetime(date)]))[0]
+        return self.industries[code] if code >= 0 else np.nan
+
+    def get_industries(self, tickers, dates) -> pd.DataFrame:
+        '''a dates x tickers table of the industry of each ticker on each date'''
+        dates, tickers = pd.DatetimeIndex(dates), pd.Index(tickers)
+        codes = self.get_codes(tickers.values[None, :], dates.values[:, None])
+        names = np.append(self.industries.values.astype(object), np.nan)
+        return pd.DataFrame(names[codes], index=dates, columns=tickers)
@@ -0,0 +1,94 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.trading_calendar import TradingCalendar
+
+from ranking import rank_within
+
+
+class MomentumPanel():
+    '''computes the lagged momentum of all industries on many dates at once, ranked within each WIND level'''
+
+    def __init__(self, prices) -> None:
+        self.prices = prices
+        self.open_days = prices.index
+        self.calendar = TradingCalendar(self.open_days)
+        # first and last quote of every industry, levels joined side by side may cover different dates
+        quoted = prices.notna().values
+        self._first = quoted.argmax(axis=0)
+        self._last = len(quoted) - 1 - quoted[::-1].argmax(axis=0)
+        self._momentum = {}
+        self._rank = {}
+
+    def month_ends(self) -> pd.DatetimeIndex:
+        '''the last trading day of every month in the price series'''
+        return self.calendar.get_period_lasts('M')
+
+    def compute_momentum(self, dates, look_back=6) -> pd.DataFrame:
+        '''the average look_back-month return lagged by look_back months, for every industry on every date'''
+        dates = pd.DatetimeIndex(dates)
+        values = self.prices.values
+        # prices are never read past the date itself
+        last = self.open_days.searchsorted(dates, side='right') - 1
+
+        start = dates - pd.DateOffset(months=look_back*2)
+        end = dates - pd.DateOffset(months=look_back)
+
+        columns = np.arange(values.shape[1])
+        total = np.zeros((len(dates), values.shape[1]))
+        count = np.zeros((len(dates), 1))
+        # month-end clamping lets the start date drift, so one extra window may fit before the end date
+        for _ in range(look_back+1):
+            local_end = start + pd.DateOffset(months=look_back)
+            in_range = np.asarray(start < end)
+
+            head = self.open_days.searchsorted(start, side='left')
+            tail = np.minimum(self.open_days.searchsorted(local_end, side='right') - 1, last)
+            # each industry's window is kept within its own quotes
+            head = np.maximum(head[:, None], self._first)
+            tail = np.minimum(tail[:, None], self._last)
+            # a window without any prices leaves the momentum undefined
+            empty = head > tail
+            head, tail = np.clip(head, 0, len(values)-1), np.clip(tail, 0, len(values)-1)
+            local_return = np.where(empty, np.nan, values[tail, columns] / values[head, columns] - 1)
+
+            total += np.where(in_range[:, None], local_return, 0)
+            count += in_range[:, None]
+
+            start = start + pd.DateOffset(months=1)
+
+        momentum = total / np.where(count > 0, count, np.nan)
+        return pd.DataFrame(momentum, index=dates, columns=self.prices.columns)
+
+    def get_momentum(self, look_back=6) -> pd.DataFrame:
+        '''the momentum of every industry on every month end'''
+        if look_back not in self._momentum:
+            self._momentum[look_back] = self.compute_momentum(self.month_ends(), look_back)
+        return self._momentum[look_back]
+
+    def get_mom_rank(self, look_back=6) -> pd.DataFrame:
+        '''the numeric rank of every industry's momentum among peers on every month end'''
+        if look_back not in self._rank:
+            momentum = self.get_momentum(look_back)
+            self._rank[look_back] = rank_within(momentum, ascending=False, method='first')
+        return self._rank[look_back]
+
+    def get_momentum_on(self, date, look_back=6) -> pd.Series:
+        '''the momentum of every industry on a date, read from the month end table when possible'''
+        date = pd.to_datetime(date)
+        momentum = self.get_momentum(look_back)
+        if date in momentum.index:
+            return momentum.loc[date]
+        return self.compute_momentum([date], look_back).iloc[0]
+
+    def get_mom_rank_on(self, date, look_back=6) -> pd.Series:
+        '''the numeric rank of every industry's momentum among peers on a date'''
+        date = pd.to_datetime(date)
+        ranks = self.get_mom_rank(look_back)
+        if date in ranks.index:
+            return ranks.loc[date]
+        return rank_within(self.get_momentum_on(date, look_back), ascending=False, method='first')
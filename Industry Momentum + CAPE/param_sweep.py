@@ -0,0 +1,80 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+from xquant.backtest.backtest import run_backtest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.metrics import PerformanceMetrics
+from common.sweep import expand_grid, run_sweep
+
+# importing the strategy loads both WIND levels and their factor panels, forked workers share them
+from cape_mom import CAPE_MOM, CAPE_PANEL, PERIODS, data
+
+GRID = {
+    'factor': ['cape', 'mom', 'combined'],
+    'scheme': ['cap', 'shiller'],
+    'n_top': [4, 8],
+    'look_back': [3, 6, 12],
+    'n_period': [10, 20, 40],
+    'level': ['I', 'II'],
+}
+
+
+def is_runnable(params, start) -> bool:
+    '''whether the quarters before the first rebalance are enough for the relative CAPE window'''
+    if params['factor'] == 'mom':
+        return True
+    n_available = PERIODS.searchsorted(pd.Timestamp(start), side='right')
+    return n_available >= params['n_period'] + CAPE_PANEL.n_quarter - 1
+
+
+def get_points(grid, start='20080101') -> list:
+    '''the grid points that can run from a start date, momentum ignores n_period so it runs once'''
+    points, seen = [], set()
+    for params in expand_grid(grid):
+        if params['factor'] == 'mom':
+            params = {**params, 'n_period': None}
+        key = tuple(params.items())
+        if key in seen or not is_runnable(params, start):
+            continue
+        seen.add(key)
+        points.append({**params, 'start': start})
+    return points
+
+
+def run_one(factor='mom', scheme='cap', n_top=8, look_back=6, n_period=None, level='II', freq=3, start='20080101', end='20191231'):
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    cape_mom = CAPE_MOM(f'{factor} {scheme} {level}', factor, scheme, n_top, look_back, n_period, level)
+    cape_mom.verbose = False
+
+    holdings = run_backtest(start, end, cape_mom.get_prices(), cape_mom.stock_selection, 100, freq)
+    performance = holdings.generate_performance(cape_mom.get_prices())
+
+    benchmark = data.get_data('benchmark')['close'][start:end]
+    benchmark = benchmark / benchmark.iloc[0] * 100
+    return PerformanceMetrics(performance, benchmark).to_dict()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='runs CAPE + momentum over a parameter grid')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', default='sweep.csv')
+    parser.add_argument('--start', default='20080101')
+    args = parser.parse_args()
+
+    points = get_points(GRID, args.start)
+    print(f'[Initilizing...] {len(points)} runnable grid points out of {len(expand_grid(GRID))} from {args.start}.')
+    if not points:
+        sys.exit('[Error...] No grid point has enough history, start the sweep later.')
+
+    t_begin = time.time()
+    df = run_sweep(run_one, points, processes=args.processes)
+    df.to_csv(args.output, index=False)
+    print(f'[Completed] {len(df)} runs in {round(time.time() - t_begin, 3)} seconds, saved to {args.output}.')
+    n_failed = df['error'].notna().sum()
+    if n_failed:
+        print(f'[Error...] {n_failed} of {len(df)} runs failed, see the error column.')
+        sys.exit(1)
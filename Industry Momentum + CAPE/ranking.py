@@ -0,0 +1,44 @@
+import pandas as pd
+
+
+def rank_within(values, **kwargs):
+    '''ranks industries among peers on every date, within each WIND level when the columns are keyed by one'''
+    if isinstance(values, pd.Series):
+        return rank_within(values.to_frame().T, **kwargs).iloc[0]
+    if values.columns.nlevels > 1:
+        return values.T.groupby(level=0, sort=False).rank(**kwargs).T
+    return values.rank(axis=1, **kwargs)
+
+
+class CrossSectionalRanker():
+    '''ranks every industry on a factor once per rebalance date and caches the rank vector'''
+
+    def __init__(self, universe) -> None:
+        self.universe = list(universe)
+        self.factors = {}
+        self._cache = {}
+
+    def register(self, factor, rank_func) -> None:
+        '''adds a factor, rank_func(date, **params) returns the ranks of all industries'''
+        self.factors[factor] = rank_func
+
+    def get_ranks(self, factor, date, **params) -> pd.Series:
+        '''the rank of every industry in the universe on a factor, 1 being the best'''
+        key = (factor, pd.to_datetime(date), tuple(sorted(params.items())))
+        if key not in self._cache:
+            ranks = self.factors[factor](date, **params)
+            self._cache[key] = ranks.reindex(self.universe)
+        return self._cache[key]
+
+    def get_top(self, factor, date, n, **params) -> list:
+        '''industries ranked within the top n'''
+        ranks = self.get_ranks(factor, date, **params)
+        return list(ranks.index[ranks <= n])
+
+    def get_bottom(self, factor, date, n, **params) -> list:
+        '''industries ranked at or below len(universe)-n'''
+        ranks = self.get_ranks(factor, date, **params)
+        return list(ranks.index[ranks >= len(self.universe)-n])
+
+    def clear(self) -> None:
+        self._cache = {}
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.datastore import DataStore, fingerprint_panel
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+class FXRates():
+    '''daily exchange rates read from a local time series, looked up as of a date'''
+
+    def __init__(self, data_dir=DATA_DIR, name='usd_cny') -> None:
+        self.data_dir = data_dir
+        self.name = name
+        self._series = None
+        self._cache = {}
+
+    def get_series(self) -> pd.Series:
+        if self._series is None:
+            df = DataStore(self.data_dir).load(self.name)
+            self._series = df['rate'].dropna()
+        return self._series
+
+    def get_rate(self, date) -> float:
+        '''the latest rate on or before a date, so holidays use the last published rate'''
+        date = pd.to_datetime(date)
+        if date not in self._cache:
+            series = self.get_series()
+            idx = series.index.searchsorted(date, side='right') - 1
+            if idx < 0:
+                raise KeyError(f'No exchange rate on or before {date.date()} in {self.name}.csv')
+            self._cache[date] = float(series.values[idx])
+        return self._cache[date]
+
+    def get_rates(self, dates) -> np.ndarray:
+        '''as-of rates for many dates at once'''
+        series = self.get_series()
+        idx = series.index.searchsorted(pd.DatetimeIndex(dates), side='right') - 1
+        if (idx < 0).any():
+            raise KeyError(f'No exchange rate on or before {pd.DatetimeIndex(dates).min().date()} in {self.name}.csv')
+        return series.values[idx]
+
+    def fingerprint(self, end_date) -> str:
+        '''identifies the rates published up to a date'''
+        return fingerprint_panel(self.get_series().to_frame(), end_date)
+
+    def fetch(self, start_date, end_date, base='USD', target='CNY') -> None:
+        '''downloads business day rates once with forex_python and saves them as the local series'''
+        from forex_python.converter import CurrencyRates
+        c = CurrencyRates()
+        dates = pd.bdate_range(start_date, end_date)
+        rates = [c.get_rate(base, target, date.to_pydatetime()) for date in dates]
+        pd.DataFrame({'rate': rates}, index=dates).to_csv(
+            os.path.join(self.data_dir, self.name + '.csv'), index_label='date')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download the USD/CNY series used by the market cap screen.')
+    parser.add_argument('--start', default='2009-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    args = parser.parse_args()
+
+    fx = FXRates()
+    fx.fetch(args.start, args.end)
+    print(f'[Fetching...] USD/CNY rates saved to {fx.data_dir}.')
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+
+class TradeLedger():
+    '''every rebalance stored as share arrays aligned to the ticker axis of the price panel'''
+
+    def __init__(self, df_prices=None, commission=0):
+        self.df_prices = df_prices
+        self.commission = commission
+        self.dates = []
+        self.holdings = []
+        self.cash = []
+        self._prices = None
+
+    @classmethod
+    def from_log(cls, log=None, df_prices=None, commission=0):
+        ledger = cls(df_prices, commission)
+        for date, portfolio in log:
+            ledger.append(date, portfolio)
+        return ledger
+
+    def get_shares(self, portfolio):
+        # dense share vector over all tickers of the price panel
+        shares = np.zeros(len(self.df_prices.columns), dtype=np.int64)
+        idx = self.df_prices.columns.get_indexer(portfolio.tickers)
+        np.add.at(shares, idx, portfolio.shares)
+        return shares
+
+    def get_trade_prices(self, date, shares):
+        # last traded prices on a date, the same prices Portfolio values holdings at
+        pos = self.df_prices.index.get_loc(pd.to_datetime(date))
+        prices = np.zeros(len(shares))
+        cols = np.flatnonzero(shares)
+        if len(cols):
+            prices[cols] = np.nan_to_num(pd.DataFrame(self.df_prices.values[:pos+1, cols]).ffill().values[-1])
+        return prices
+
+    def get_commission(self, date=None, portfolio=None):
+        '''commission charged for trading from the last recorded holdings into a portfolio'''
+        shares = self.get_shares(portfolio)
+        previous = self.holdings[-1] if self.holdings else np.zeros_like(shares)
+        delta = shares - previous
+        return self.commission * (np.abs(delta) @ self.get_trade_prices(date, delta))
+
+    def append(self, date=None, portfolio=None):
+        '''records a rebalance'''
+        self.dates.append(pd.to_datetime(date))
+        self.holdings.append(self.get_shares(portfolio))
+        self.cash.append(portfolio.cash)
+        self._prices = None
+
+    def get_holdings(self):
+        return np.vstack(self.holdings)
+
+    def get_deltas(self):
+        # share changes at every rebalance, the first row is the initial purchase
+        holdings = self.get_holdings()
+        return np.diff(holdings, axis=0, prepend=0)
+
+    def get_prices(self):
+        '''last traded prices of every ticker ever traded, on every rebalance date'''
+        if self._prices is None:
+            holdings = self.get_holdings()
+            cols = np.flatnonzero(np.abs(holdings).sum(axis=0))
+            positions = self.df_prices.index.get_indexer(pd.DatetimeIndex(self.dates))
+            end = positions.max() + 1
+            prices = np.zeros(holdings.shape)
+            prices[:, cols] = np.nan_to_num(pd.DataFrame(self.df_prices.values[:end, cols]).ffill().values[positions])
+            self._prices = prices
+        return self._prices
+
+    def get_trades(self):
+        '''buy and sell notional and commission cost of every rebalance'''
+        deltas, prices = self.get_deltas(), self.get_prices()
+        buy = (np.clip(deltas, 0, None) * prices).sum(axis=1)
+        sell = (np.clip(-deltas, 0, None) * prices).sum(axis=1)
+        df = pd.DataFrame({'buy': buy, 'sell': sell}, index=pd.DatetimeIndex(self.dates))
+        df['cost'] = (df['buy'] + df['sell']) * self.commission
+        return df
+
+    def get_net_liquidation(self):
+        '''value of each portfolio on its own rebalance date'''
+        return (self.get_holdings() * self.get_prices()).sum(axis=1) + np.array(self.cash)
+
+    def get_turnover_ratio(self, start_date=None, end_date=None):
+        '''average annual one-way turnover as a share of the average portfolio value'''
+        dates = pd.DatetimeIndex(self.dates)
+        window = (dates >= pd.to_datetime(start_date)) & (dates <= pd.to_datetime(end_date))
+        rows = np.flatnonzero(window)
+
+        trades = self.get_trades().iloc[rows]
+        liquidation = self.get_net_liquidation()[rows]
+        avg_liquidation = (liquidation[0] + liquidation[-1]) / 2
+        n_years = dates[rows[-1]].year - dates[rows[0]].year
+
+        # the trades that opened the first portfolio of the window are not turnover
+        agg_turnover = ((trades['buy'] + trades['sell']) / 2).iloc[1:].sum()
+        return agg_turnover / n_years / avg_liquidation
+
+    def get_holding_periods(self):
+        '''how many days each position was held, positions still open end on the last rebalance'''
+        held = self.get_holdings() > 0
+        dates = pd.DatetimeIndex(self.dates)
+        padded = np.vstack([np.zeros((1, held.shape[1]), dtype=bool), held, np.zeros((1, held.shape[1]), dtype=bool)])
+        change = np.diff(padded.astype(np.int8), axis=0)
+        # entries and exits come in the same column order, so they pair up
+        entry_col, entry_row = np.nonzero(change.T == 1)
+        exit_col, exit_row = np.nonzero(change.T == -1)
+        exit_row = np.minimum(exit_row, len(dates) - 1)
+
+        periods = pd.DataFrame({
+            'ticker': self.df_prices.columns[entry_col],
+            'entry': dates[entry_row],
+            'exit': dates[exit_row],
+        })
+        periods['days'] = (periods['exit'] - periods['entry']).dt.days
+        return periods
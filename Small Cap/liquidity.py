@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.profiling import profile
+
+
+class ATVREngine():
+    '''computes the annualized traded value ratio (ATVR) of every stock for every month at once'''
+
+    def __init__(self, df_mcap=None, df_volume=None, n_month=12):
+        self.df_mcap = df_mcap
+        self.df_volume = df_volume.reindex(index=df_mcap.index, columns=df_mcap.columns)
+        self.n_month = n_month
+        self._mtvr = None
+        self._atvr = None
+
+    @profile('MTVR')
+    def get_mtvr(self):
+        '''the monthly traded value ratio of every stock in every calendar month'''
+        if self._mtvr is None:
+            volume = self.df_volume.values
+            # days without trading are left out, as are missing values
+            valid = ~np.isnan(volume) & (volume != 0)
+            months = self.df_mcap.index.to_period('M')
+            starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+
+            # daily traded value is reported in thousands, market cap in ten thousands
+            med = self.df_volume.where(valid).groupby(months).median().values * 1000
+            count = np.add.reduceat(valid, starts, axis=0)
+            # market cap on the last traded day of each month
+            rows = np.where(valid, np.arange(len(volume))[:, None], -1)
+            last = np.maximum.reduceat(rows, starts, axis=0)
+            mkt_cap = self.df_mcap.values[np.maximum(last, 0), np.arange(volume.shape[1])] * 10000
+            mkt_cap[last < 0] = np.nan
+
+            mtvr = pd.DataFrame(med * count / mkt_cap, index=months[starts], columns=self.df_mcap.columns)
+            # make sure calendar months without any trading day still take up a row
+            self._mtvr = mtvr.reindex(pd.period_range(months[0], months[-1]+1, freq='M'))
+        return self._mtvr
+
+    @profile('ATVR')
+    def get_atvr(self):
+        '''the ATVR used for rebalances in each month, averaged over the previous n_month months'''
+        if self._atvr is None:
+            mtvr = self.get_mtvr()
+            # a stock without trades in any of the months gets no ATVR
+            self._atvr = mtvr.rolling(self.n_month).mean().shift(1) * 12
+        return self._atvr
+
+    def get_atvr_on(self, date=None):
+        '''the ATVR of every stock for a rebalance on a date'''
+        atvr = self.get_atvr()
+        month = pd.Period(pd.to_datetime(date), freq='M')
+        if month not in atvr.index:
+            return pd.Series(np.nan, index=atvr.columns)
+        return atvr.loc[month]
+
+    def get_atvr_matrix(self, dates=None):
+        '''the ATVR of every stock for each rebalance date, as a dates x stocks table'''
+        dates = pd.DatetimeIndex(dates)
+        atvr = self.get_atvr().reindex(dates.to_period('M'))
+        return atvr.set_index(dates)
@@ -0,0 +1,171 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.profiling import profile
+from liquidity import ATVREngine
+from small_cap import BackTest, Portfolio
+
+
+class LiveEngine():
+    '''runs the small cap strategy forward one trading day at a time from a checkpoint
+
+    The state is the current portfolio, the last traded price of every ticker and the date
+    of the last rebalance. A day only reads that day's price row, and a rebalance screens on
+    a trailing window of the panels long enough for ATVR, so the cost of a step does not
+    grow with the length of the history. Stepping through every trading day reproduces
+    BackTest.run_backtest exactly.
+    '''
+
+    def __init__(self, bt=None, freq=6, weight='equal', cash_ratio=0, init_weight='cap', n_month=12):
+        self.bt = bt
+        self.freq = freq
+        self.weight = weight
+        self.cash_ratio = cash_ratio
+        self.init_weight = init_weight
+        self.n_month = n_month
+
+        self.date = None
+        self.last_rebalance = None
+        self.portfolio = None
+        self.last_prices = None
+        self.nav_dates = []
+        self.nav = []
+        self.log = []
+        self.screening = {}
+
+    @property
+    def open_days(self):
+        return self.bt.data[1].index
+
+    def is_rebalance_day(self, date):
+        if self.last_rebalance is None:
+            return date >= pd.to_datetime(self.bt.start_date)
+        # the full replay stops rebalancing within six months of the end date
+        if self.bt.end_date is not None and self.last_rebalance > pd.to_datetime(self.bt.end_date) - pd.DateOffset(months=6):
+            return False
+        return date >= self.last_rebalance + relativedelta(months=self.freq)
+
+    def get_window(self, date):
+        # every month ATVR looks back on, plus the rebalance month itself
+        start = (pd.Period(date, freq='M') - self.n_month).start_time
+        return tuple(df.loc[start:date] for df in self.bt.data)
+
+    def get_net_liquidation(self, portfolio=None):
+        portfolio = portfolio or self.portfolio
+        return np.nan_to_num(self.last_prices[portfolio.idx]) @ portfolio.shares + portfolio.cash
+
+    @profile('live rebalance')
+    def rebalance(self, date):
+        window = self.get_window(date)
+        bt = BackTest(self.bt.start_date, self.bt.end_date, self.bt.init_funds, self.bt.commission,
+                      data=window, reference=self.bt.reference, fx=self.bt.fx)
+        bt.pipeline = self.bt.pipeline
+        bt.atvr = ATVREngine(window[0], window[2], self.n_month)
+
+        if self.portfolio is None:
+            funds, weight = self.bt.init_funds, self.init_weight
+        else:
+            funds, weight = self.get_net_liquidation(), self.weight
+        p = bt.get_portfolio(funds_available=funds, cash_ratio=self.cash_ratio, date=date, weight=weight)
+        p = Portfolio(stocks=p.stocks, cash=p.cash, df_prices=self.bt.data[1])
+
+        # commission on the shares traded, at the same last traded prices the ledger uses
+        delta = np.zeros(len(self.last_prices), dtype=np.int64)
+        np.add.at(delta, p.idx, p.shares)
+        if self.portfolio is not None:
+            np.subtract.at(delta, self.portfolio.idx, self.portfolio.shares)
+        p.cash -= self.bt.commission * (np.abs(delta) @ np.nan_to_num(self.last_prices))
+
+        self.portfolio = p
+        self.last_rebalance = date
+        self.log.append((date, p))
+        self.screening[date] = bt.screening[date]
+
+    def step(self, date=None):
+        '''processes one trading day, the next one after the checkpoint by default'''
+        df_prices = self.bt.data[1]
+        if date is None:
+            pos = 0 if self.date is None else self.open_days.searchsorted(self.date, side='right')
+            date = self.open_days[pos]
+        date = pd.to_datetime(date)
+
+        if self.last_prices is None:
+            # the only pass over the history, to know the last traded price of every ticker
+            self.last_prices = df_prices.loc[:date].ffill().values[-1].astype(float)
+        else:
+            row = df_prices.loc[date].values
+            self.last_prices = np.where(np.isnan(row), self.last_prices, row)
+
+        if self.is_rebalance_day(date):
+            print(f'\n[Rebalancing...] {date.date()}')
+            self.rebalance(date)
+        if self.portfolio is not None:
+            self.nav_dates.append(date)
+            self.nav.append(self.get_net_liquidation())
+        self.date = date
+        return date
+
+    def advance(self, until=None):
+        '''processes every trading day after the checkpoint up to a date, one day by default'''
+        if until is None:
+            return self.step()
+        first = 0 if self.date is None else self.open_days.searchsorted(self.date, side='right')
+        last = self.open_days.searchsorted(pd.to_datetime(until), side='right')
+        for date in self.open_days[first:last]:
+            self.step(date)
+        return self.date
+
+    def advance_rebalance(self):
+        '''processes trading days until the next rebalance has been made'''
+        n = len(self.log)
+        while len(self.log) == n and self.date != self.open_days[-1]:
+            self.step()
+        return self.date
+
+    def get_nav(self):
+        return pd.Series(self.nav, index=pd.DatetimeIndex(self.nav_dates))
+
+    def save(self, path):
+        '''writes the checkpoint, a state file next to the price and holding arrays'''
+        os.makedirs(path, exist_ok=True)
+        state = {
+            'date': str(self.date.date()),
+            'last_rebalance': str(self.last_rebalance.date()) if self.last_rebalance is not None else None,
+            'params': {'freq': self.freq, 'weight': self.weight, 'cash_ratio': self.cash_ratio,
+                       'init_weight': self.init_weight, 'n_month': self.n_month},
+            'cash': float(self.portfolio.cash) if self.portfolio is not None else None,
+            'tickers': list(map(str, self.portfolio.tickers)) if self.portfolio is not None else [],
+            'columns': list(map(str, self.bt.data[1].columns)),
+        }
+        np.save(os.path.join(path, 'last_prices.npy'), self.last_prices)
+        np.save(os.path.join(path, 'shares.npy'), self.portfolio.shares if self.portfolio is not None else np.array([], dtype=np.int64))
+        np.save(os.path.join(path, 'nav_dates.npy'), np.array(self.nav_dates, dtype='datetime64[ns]'))
+        np.save(os.path.join(path, 'nav.npy'), np.array(self.nav, dtype=float))
+        # the state is written last, a checkpoint without it is incomplete
+        with open(os.path.join(path, 'state.json'), 'w') as f:
+            json.dump(state, f, indent=2)
+
+    @classmethod
+    def load(cls, path, bt):
+        '''resumes from a checkpoint on the panels of a backtest, which may have new dates and tickers'''
+        with open(os.path.join(path, 'state.json')) as f:
+            state = json.load(f)
+        engine = cls(bt, **state['params'])
+        engine.date = pd.to_datetime(state['date'])
+        engine.last_rebalance = pd.to_datetime(state['last_rebalance']) if state['last_rebalance'] else None
+
+        last_prices = pd.Series(np.load(os.path.join(path, 'last_prices.npy')), index=state['columns'])
+        engine.last_prices = last_prices.reindex(bt.data[1].columns).values
+        if state['cash'] is not None:
+            shares = np.load(os.path.join(path, 'shares.npy')).tolist()
+            engine.portfolio = Portfolio(stocks=dict(zip(state['tickers'], shares)), cash=state['cash'], df_prices=bt.data[1])
+            engine.log.append((engine.last_rebalance, engine.portfolio))
+        engine.nav_dates = list(pd.DatetimeIndex(np.load(os.path.join(path, 'nav_dates.npy'))))
+        engine.nav = np.load(os.path.join(path, 'nav.npy')).tolist()
+        return engine
@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.datastore import DataStore
+from common.sweep import run_sweep
+from fx import FXRates
+from liquidity import ATVREngine
+from reference_data import LocalProvider
+from small_cap import DATA_DIR, BackTest
+
+# panels and providers opened once in every worker process
+WORKER = {}
+PANELS = ('market_cap', 'price', 'volume')
+BENCHMARK = '000300.XSHG'
+
+GRID = {
+    'freq': [3, 6, 12],
+    'weight': ['equal', 'cap'],
+    'cash_ratio': [0, 0.05],
+}
+
+
+def prepare_store(data_dir=DATA_DIR, start_date='2010-01-01', end_date='2020-12-31') -> None:
+    '''converts every stale CSV once in the parent, so workers never write to the store'''
+    store = DataStore(data_dir)
+    for name in PANELS:
+        store.load(name)
+    FXRates(data_dir).get_series()
+    reference = LocalProvider()
+    reference.load_st_panel()
+    # the benchmark generate_performance reads in every run
+    reference.get_price(BENCHMARK, start_date, end_date)
+
+
+def init_worker(data_dir=DATA_DIR):
+    # the panels are memory-mapped from the store, so all workers share the same pages
+    store = DataStore(data_dir)
+    WORKER['data'] = tuple(store.open(name) for name in PANELS)
+    WORKER['reference'] = LocalProvider()
+    WORKER['fx'] = FXRates()
+    WORKER['atvr'] = ATVREngine(WORKER['data'][0], WORKER['data'][2])
+
+
+def run_one(start_date='2010-01-01', end_date='2020-12-31', freq=6, weight='equal', cash_ratio=0, commission=0):
+    bt = BackTest(start_date=start_date, end_date=end_date, commission=commission,
+                  data=WORKER['data'], reference=WORKER['reference'], fx=WORKER['fx'])
+    # ATVR does not depend on the parameters, every run of a worker reuses it
+    bt.atvr = WORKER['atvr']
+    bt.run_backtest(freq=freq, weight=weight, cash_ratio=cash_ratio)
+    performance = bt.generate_performance()
+    return bt.get_metrics(performance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='runs the small cap backtest over a parameter grid')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', default='sweep.csv')
+    args = parser.parse_args()
+
+    t_begin = time.time()
+    prepare_store()
+    df = run_sweep(run_one, GRID, processes=args.processes, initializer=init_worker)
+    df.to_csv(args.output, index=False)
+    print(f'[Completed] {len(df)} runs in {round(time.time() - t_begin, 3)} seconds, saved to {args.output}.')
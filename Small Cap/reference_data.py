@@ -0,0 +1,229 @@
+import argparse
+import hashlib
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.datastore import DataStore, fingerprint_panel
+from common.security_master import convert_symbols
+
+REFERENCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'reference')
+
+
+class ReferenceData():
+    '''point-in-time reference data needed by the small cap strategy, keyed by JoinQuant symbols'''
+
+    def get_st_flags(self, stocks, date) -> pd.Series:
+        '''whether each stock is labeled ST or ST* on a date'''
+        raise NotImplementedError
+
+    def get_industries(self, stocks, date) -> dict:
+        '''the Shenwan level 1 industry name of each stock on a date, unclassified stocks are left out'''
+        raise NotImplementedError
+
+    def get_price(self, security, start_date, end_date) -> pd.DataFrame:
+        '''daily prices of a security such as the benchmark index'''
+        raise NotImplementedError
+
+    def fingerprint(self, end_date) -> str:
+        '''identifies the data served up to a date, a live source has no version beyond its name'''
+        return type(self).__name__
+
+
+class JQDataProvider(ReferenceData):
+    '''reads reference data from the JoinQuant API, every call costs queries'''
+
+    def __init__(self) -> None:
+        from jqdatasdk import api as jqdata
+        self.jqdata = jqdata
+
+    def get_st_flags(self, stocks, date) -> pd.Series:
+        return self.get_st_panel(stocks, date, date).loc[pd.to_datetime(date)]
+
+    def get_st_panel(self, stocks, start_date, end_date) -> pd.DataFrame:
+        return self.jqdata.get_extras('is_st', list(stocks), start_date=start_date, end_date=end_date)
+
+    def get_industries(self, stocks, date) -> dict:
+        industries = self.jqdata.get_industry(list(stocks), pd.to_datetime(date))
+        d = {}
+        for stock in stocks:
+            try:
+                d[stock] = industries[stock]['sw_l1']['industry_name']
+            except KeyError:
+                continue
+        return d
+
+    def get_price(self, security, start_date, end_date) -> pd.DataFrame:
+        return self.jqdata.get_price(security, start_date=start_date, end_date=end_date)
+
+
+class LocalProvider(ReferenceData):
+    '''reads reference data from an on-disk point-in-time store
+
+    ST flags are a date x stock panel, industries are dated snapshots and prices are
+    one table per security. Anything missing is fetched from the source provider, if
+    one is given, and written back so that repeated runs cost nothing.
+    '''
+
+    def __init__(self, root=REFERENCE_DIR, source=None) -> None:
+        self.root = root
+        self.source = source
+        self.store = DataStore(root)
+        os.makedirs(root, exist_ok=True)
+        self._industries = None
+
+    def path(self, name) -> str:
+        return os.path.join(self.root, name + '.csv')
+
+    def load_st_panel(self) -> pd.DataFrame:
+        if not os.path.exists(self.path('is_st')):
+            return pd.DataFrame(dtype=float)
+        return self.store.load('is_st')
+
+    def save_st_panel(self, panel) -> None:
+        existing = self.load_st_panel()
+        panel = panel.astype(float).combine_first(existing) if len(existing) else panel.astype(float)
+        panel.sort_index().to_csv(self.path('is_st'), index_label='date')
+
+    def get_st_flags(self, stocks, date) -> pd.Series:
+        date = pd.to_datetime(date)
+        panel = self.load_st_panel()
+        missing = list(stocks)
+        if date in panel.index:
+            row = panel.loc[date].reindex(missing)
+            missing = list(row.index[row.isna()])
+        if missing:
+            if self.source is None:
+                raise KeyError(f'No ST flags stored on {date.date()} for {len(missing)} stocks')
+            self.save_st_panel(self.source.get_st_panel(missing, date, date))
+            panel = self.load_st_panel()
+        return panel.loc[date].reindex(list(stocks)).astype(bool)
+
+    def load_industries(self) -> pd.DataFrame:
+        if self._industries is None:
+            if os.path.exists(self.path('sw_l1')):
+                self._industries = pd.read_csv(self.path('sw_l1'), parse_dates=['date'])
+            else:
+                self._industries = pd.DataFrame(columns=['date', 'stock', 'industry'])
+        return self._industries
+
+    def save_industries(self, date, industries) -> None:
+        records = pd.DataFrame({'date': pd.to_datetime(date), 'stock': list(industries.keys()),
+                                'industry': list(industries.values())})
+        df = pd.concat([self.load_industries(), records], ignore_index=True)
+        df = df.drop_duplicates(subset=['date', 'stock'], keep='last').sort_values(['date', 'stock'])
+        df.to_csv(self.path('sw_l1'), index=False)
+        self._industries = df
+
+    def get_industries(self, stocks, date) -> dict:
+        date = pd.to_datetime(date)
+        df = self.load_industries()
+        # use the latest snapshot taken on or before the date
+        dates = df['date'][df['date'] <= date]
+        snapshot = df[df['date'] == dates.max()] if len(dates) else df.iloc[:0]
+
+        stored = set(snapshot['stock'])
+        missing = [stock for stock in stocks if stock not in stored]
+        if missing and self.source is not None:
+            fetched = self.source.get_industries(missing, date)
+            # carry the older snapshot forward so the new one stays complete
+            industries = dict(zip(snapshot['stock'], snapshot['industry']))
+            industries.update({stock: fetched.get(stock) for stock in missing})
+            self.save_industries(date, industries)
+            return self.get_industries(stocks, date)
+        if len(dates) == 0:
+            raise KeyError(f'No industry snapshot stored on or before {date.date()}')
+
+        # unclassified stocks are stored without an industry
+        snapshot = snapshot.dropna(subset=['industry']).set_index('stock')['industry']
+        return {stock: snapshot[stock] for stock in stocks if stock in snapshot.index}
+
+    def get_price(self, security, start_date, end_date) -> pd.DataFrame:
+        start_date, end_date = pd.to_datetime(start_date), pd.to_datetime(end_date)
+        if os.path.exists(self.path(security)):
+            df = self.store.load(security)
+            if len(df) and df.index[0] <= start_date and df.index[-1] >= end_date:
+                return df.loc[start_date:end_date]
+        if self.source is None:
+            raise KeyError(f'No prices stored for {security} from {start_date.date()} to {end_date.date()}')
+        self.source.get_price(security, start_date, end_date).to_csv(self.path(security), index_label='date')
+        return self.store.load(security).loc[start_date:end_date]
+
+    def fingerprint(self, end_date) -> str:
+        # hashes the stored ST flags, industry snapshots and prices up to a date
+        end_date = pd.to_datetime(end_date)
+        h = hashlib.sha1(self.root.encode())
+        df = self.load_industries()
+        h.update(df[df['date'] <= end_date].to_csv(index=False).encode())
+        for name in sorted(f[:-4] for f in os.listdir(self.root) if f.endswith('.csv') and f != 'sw_l1.csv'):
+            h.update(name.encode())
+            h.update(fingerprint_panel(self.store.load(name), end_date).encode())
+        return h.hexdigest()
+
+    def prefetch(self, stocks, start_date, end_date, dates=None, benchmark='000300.XSHG') -> None:
+        '''bulk downloads everything a backtest between two dates needs from the source'''
+        stocks = list(stocks)
+        # ST flags come back as a whole panel, requested in chunks to keep each query small
+        for i in range(0, len(stocks), 500):
+            self.save_st_panel(self.source.get_st_panel(stocks[i:i+500], start_date, end_date))
+        # industries are snapshots, one per requested date (month ends by default)
+        if dates is None:
+            dates = pd.date_range(start_date, end_date, freq=pd.offsets.MonthEnd())
+        for date in dates:
+            fetched = self.source.get_industries(stocks, date)
+            self.save_industries(date, {stock: fetched.get(stock) for stock in stocks})
+        self.source.get_price(benchmark, start_date, end_date).to_csv(self.path(benchmark), index_label='date')
+
+
+class FakeProvider(ReferenceData):
+    '''serves reference data from in-memory fixtures, for running without network access'''
+
+    def __init__(self, st_flags=None, industries=None, prices=None) -> None:
+        # st_flags is a date x stock DataFrame, industries maps stock to industry and prices maps security to a DataFrame
+        self.st_flags = st_flags if st_flags is not None else pd.DataFrame(dtype=bool)
+        self.industries = industries or {}
+        self.prices = prices or {}
+
+    def get_st_flags(self, stocks, date) -> pd.Series:
+        date = pd.to_datetime(date)
+        if date not in self.st_flags.index:
+            return pd.Series(False, index=list(stocks))
+        return self.st_flags.loc[date].reindex(list(stocks)).fillna(False).astype(bool)
+
+    def get_st_panel(self, stocks, start_date, end_date) -> pd.DataFrame:
+        return self.st_flags.loc[start_date:end_date].reindex(columns=list(stocks)).fillna(False)
+
+    def get_industries(self, stocks, date) -> dict:
+        return {stock: self.industries[stock] for stock in stocks if stock in self.industries}
+
+    def get_price(self, security, start_date, end_date) -> pd.DataFrame:
+        return self.prices[security].loc[pd.to_datetime(start_date):pd.to_datetime(end_date)]
+
+    def fingerprint(self, end_date) -> str:
+        h = hashlib.sha1(fingerprint_panel(self.st_flags, end_date).encode())
+        h.update(repr(sorted(self.industries.items())).encode())
+        for security in sorted(self.prices):
+            h.update(security.encode())
+            h.update(fingerprint_panel(self.prices[security], end_date).encode())
+        return h.hexdigest()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prefetch reference data from JoinQuant into the local store.')
+    parser.add_argument('--start', default='2010-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    args = parser.parse_args()
+
+    import jqdatasdk
+    jqdatasdk.auth(args.username, args.password)
+
+    df_mcap = DataStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')).load('market_cap')
+    stocks = list(convert_symbols(df_mcap.columns, 'jq'))
+
+    provider = LocalProvider(source=JQDataProvider())
+    provider.prefetch(stocks, args.start, args.end)
+    print(f'[Prefetching...] Reference data for {len(stocks)} stocks saved to {provider.root}.')
@@ -0,0 +1,166 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.datastore import fingerprint_panel
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+PANELS = ('market_cap', 'price', 'volume')
+
+
+def run_key(params) -> str:
+    '''identifies a strategy configuration, the end date is left out so longer runs share the key'''
+    params = {k: v for k, v in params.items() if k != 'end_date'}
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def fingerprint_inputs(bt, end_date) -> dict:
+    '''fingerprints of the panels, the reference data and the exchange rates a run reads up to a date'''
+    fingerprints = {name: fingerprint_panel(df, end_date) for name, df in zip(PANELS, bt.data)}
+    fingerprints['reference'] = bt.reference.fingerprint(end_date)
+    fingerprints['fx'] = bt.fx.fingerprint(end_date)
+    return fingerprints
+
+
+class ResultStore():
+    '''keeps backtest results as compact columnar files, one version per run end date
+
+    A run lives in <root>/<key>/<end date>/ next to a manifest with its parameters and the
+    fingerprints of its inputs (panels, reference data and FX rates) over the dates it used. Holdings are stored sparse
+    (rebalance, ticker, shares), so nothing references the price panel.
+    '''
+
+    def __init__(self, root=RESULTS_DIR) -> None:
+        self.root = root
+
+    def version_dir(self, key, end_date) -> str:
+        return os.path.join(self.root, key, pd.to_datetime(end_date).strftime('%Y%m%d'))
+
+    def get_versions(self, key) -> list:
+        '''manifests of every stored version of a configuration, earliest end date first'''
+        path = os.path.join(self.root, key)
+        if not os.path.isdir(path):
+            return []
+        manifests = []
+        for version in sorted(os.listdir(path)):
+            manifest = os.path.join(path, version, 'manifest.json')
+            if os.path.exists(manifest):
+                with open(manifest) as f:
+                    manifests.append(json.load(f))
+        return manifests
+
+    def is_valid(self, manifest, bt) -> bool:
+        # the inputs must be unchanged over the dates the stored run used
+        return manifest['fingerprints'] == fingerprint_inputs(bt, manifest['end_date'])
+
+    def lookup(self, params, bt):
+        '''the stored run with the latest end date not after the requested one, or None'''
+        end_date = pd.to_datetime(params['end_date'])
+        versions = [m for m in self.get_versions(run_key(params)) if pd.to_datetime(m['end_date']) <= end_date]
+        for manifest in reversed(versions):
+            if self.is_valid(manifest, bt):
+                return manifest
+        return None
+
+    def save(self, params, bt, df_performance) -> dict:
+        key = run_key(params)
+        path = self.version_dir(key, params['end_date'])
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        ledger = bt.get_ledger()
+        holdings = ledger.get_holdings()
+        rows, cols = np.nonzero(holdings)
+        # only tickers that were ever held are named, their positions index into that list
+        used, cols = np.unique(cols, return_inverse=True)
+        trades = ledger.get_trades()
+
+        arrays = {
+            'dates': np.array(ledger.dates, dtype='datetime64[ns]'),
+            'cash': np.array(ledger.cash, dtype=float),
+            'holding_rows': rows.astype(np.int32),
+            'holding_cols': cols.astype(np.int32),
+            'holding_shares': holdings[rows, used[cols]],
+            'trades': trades[['buy', 'sell', 'cost']].values,
+            'nav_index': bt.nav.index.values,
+            'nav': bt.nav.values,
+            'performance_index': df_performance.index.values,
+            'performance': df_performance.values.astype(float),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), array)
+
+        manifest = {
+            'key': key,
+            'params': json.loads(json.dumps(params, default=str)),
+            'end_date': str(pd.to_datetime(params['end_date']).date()),
+            'fingerprints': fingerprint_inputs(bt, params['end_date']),
+            'tickers': list(map(str, bt.data[1].columns[used])),
+            'performance_columns': list(df_performance.columns),
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        # the manifest is written last and the directory swapped in whole
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return manifest
+
+    def load(self, manifest):
+        '''the holdings as (date, stocks, cash) records, NAV and performance frame of a stored run'''
+        path = self.version_dir(manifest['key'], manifest['end_date'])
+        arrays = {name[:-4]: np.load(os.path.join(path, name)) for name in os.listdir(path) if name.endswith('.npy')}
+        tickers = np.array(manifest['tickers'], dtype=object)
+
+        holdings = []
+        rows, cols, shares = arrays['holding_rows'], arrays['holding_cols'], arrays['holding_shares']
+        for i, (date, cash) in enumerate(zip(pd.DatetimeIndex(arrays['dates']), arrays['cash'])):
+            held = rows == i
+            holdings.append((date, dict(zip(tickers[cols[held]], shares[held].tolist())), float(cash)))
+
+        nav = pd.Series(arrays['nav'], index=pd.DatetimeIndex(arrays['nav_index']))
+        df_performance = pd.DataFrame(arrays['performance'], index=pd.DatetimeIndex(arrays['performance_index']),
+                                      columns=manifest['performance_columns'])
+        df_performance.index.name = 'date'
+        return holdings, nav, df_performance
+
+
+def run_cached(bt, store=None, **params):
+    '''runs a backtest through the result store and returns its performance frame
+
+    An unchanged configuration is loaded as is. When only the end date moved forward, the
+    stored log is restored and the backtest resumes after its last rebalance.
+    '''
+    store = store or ResultStore()
+    run_params = {'freq': 6, 'weight': 'equal', 'cash_ratio': 0, 'init_weight': 'cap', **params}
+    key_params = {'start_date': bt.start_date, 'end_date': bt.end_date, 'init_funds': bt.init_funds,
+                  'commission': bt.commission, **run_params}
+
+    manifest = store.lookup(key_params, bt)
+    if manifest is not None:
+        holdings, nav, df_performance = store.load(manifest)
+        bt.restore_log(holdings)
+        if pd.to_datetime(manifest['end_date']) == pd.to_datetime(bt.end_date):
+            print(f'[Loading...] Results {manifest["key"]} served from the store.')
+            bt.nav = nav
+            return df_performance
+        print(f'[Resuming...] Extending results {manifest["key"]} from {manifest["end_date"]}.')
+
+    n_cached = len(bt.log)
+    bt.run_backtest(**run_params)
+    if manifest is not None:
+        # NAV is kept only up to the first rebalance the resumed run added
+        if len(bt.log) > n_cached:
+            nav = nav[nav.index < bt.log[n_cached][0]]
+        bt.nav = nav
+    df_performance = bt.generate_performance()
+    store.save(key_params, bt, df_performance)
+    return df_performance
@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.profiling import PROFILER
+from common.security_master import SecurityMaster, convert_symbols
+
+
+def to_jq_symbols(tickers):
+    '''converts Wind tickers (e.g. 000001.SZ) into JoinQuant symbols (e.g. 000001.XSHE) in bulk'''
+    return convert_symbols(tickers, 'jq')
+
+
+class ScreenContext():
+    '''the data every screening stage can read on one rebalance date'''
+
+    def __init__(self, date=None, df_mcap=None, reference=None, fx=None, atvr=None, securities=None):
+        self.date = pd.to_datetime(date)
+        self.df_mcap = df_mcap
+        self.reference = reference
+        self.fx = fx
+        self.atvr = atvr
+        self.tickers = df_mcap.columns
+        # market cap of every ticker on the date, in CNY
+        self.mcap = df_mcap.loc[self.date].values * 10000
+        # tickers resolve to security IDs once, symbols for other vendors are array lookups
+        self.securities = securities or SecurityMaster(self.tickers)
+        self.ids = self.securities.get_ids(self.tickers)
+        self.symbols = self.securities.to_jq(self.ids)
+        self._atvr = None
+
+    def get_atvr(self):
+        '''ATVR of every ticker on the date, aligned with the ticker axis'''
+        if self._atvr is None:
+            self._atvr = self.atvr.get_atvr_on(self.date).reindex(self.tickers).values
+        return self._atvr
+
+
+class Stage():
+    '''a screening step, narrows down a boolean mask over the ticker axis'''
+    name = 'stage'
+
+    def apply(self, context, mask):
+        raise NotImplementedError
+
+
+class MissingValueStage(Stage):
+    '''excludes companies without a market cap on the date'''
+    name = 'missing values'
+
+    def apply(self, context, mask):
+        return mask & ~np.isnan(context.mcap)
+
+
+class MarketCapStage(Stage):
+    '''excludes companies with market cap outside a USD band'''
+    name = 'market cap'
+
+    def __init__(self, low=200000000, high=1500000000):
+        self.low = low
+        self.high = high
+
+    def apply(self, context, mask):
+        rate = context.fx.get_rate(context.date)
+        with np.errstate(invalid='ignore'):
+            return mask & (rate*self.low <= context.mcap) & (context.mcap <= rate*self.high)
+
+
+class STStage(Stage):
+    '''excludes companies labeled ST or ST* by regulators'''
+    name = 'ST'
+
+    def apply(self, context, mask):
+        symbols = context.symbols[mask]
+        is_st = context.reference.get_st_flags(symbols, context.date).reindex(symbols).values
+        eligible = mask.copy()
+        eligible[mask] = ~is_st.astype(bool)
+        return eligible
+
+
+class ListingAgeStage(Stage):
+    '''excludes companies with a short trading history'''
+    name = 'listing age'
+
+    def __init__(self, days=180):
+        self.days = days
+        self._first_valid = (None, None)
+
+    def first_valid(self, df_mcap):
+        # the first date with a market cap, computed once per panel
+        if self._first_valid[0] is not df_mcap:
+            valid = df_mcap.notna().values
+            first = df_mcap.index.values[valid.argmax(axis=0)]
+            first[~valid.any(axis=0)] = np.datetime64('NaT')
+            self._first_valid = (df_mcap, first)
+        return self._first_valid[1]
+
+    def apply(self, context, mask):
+        first = self.first_valid(context.df_mcap)
+        age = np.datetime64(context.date) - first
+        return mask & (age > np.timedelta64(self.days, 'D'))
+
+
+class LiquidityStage(Stage):
+    '''excludes companies with an ATVR below a floor or in the bottom percentile of the universe'''
+    name = 'liquidity'
+
+    def __init__(self, floor=0.05, percentile=20):
+        self.floor = floor
+        self.percentile = percentile
+
+    def apply(self, context, mask):
+        atvr = context.get_atvr()
+        values = atvr[mask & ~np.isnan(atvr)]
+        threshold = np.percentile(values, self.percentile)
+        with np.errstate(invalid='ignore'):
+            return mask & (atvr >= self.floor) & (atvr >= threshold)
+
+
+class RepresentationStage(Stage):
+    '''keeps the most liquid companies of each industry until they cover a share of its market cap'''
+    name = 'representation'
+
+    def __init__(self, coverage=0.4):
+        self.coverage = coverage
+
+    def apply(self, context, mask):
+        # industry market caps are measured on every company with a market cap
+        universe = ~np.isnan(context.mcap)
+        industries = context.reference.get_industries(context.symbols[universe], context.date)
+        industry = pd.Series(context.symbols).map(industries).values
+
+        df = pd.DataFrame({'industry': industry, 'cap': context.mcap, 'atvr': context.get_atvr()})
+        industry_cap = df[universe].groupby('industry')['cap'].sum()
+
+        df = df[mask & pd.notna(industry)]
+        df = df.sort_values(['industry', 'atvr'], ascending=[True, False], kind='mergesort')
+        # add companies by descending ATVR while the covered market cap is within the threshold
+        covered = df.groupby('industry')['cap'].cumsum() - df['cap']
+        threshold = df['industry'].map(industry_cap) * self.coverage
+        size = df.groupby('industry')['cap'].transform('size')
+        keep = (covered <= threshold) | (size == 1)
+
+        eligible = np.zeros_like(mask)
+        eligible[keep.index[keep]] = True
+        return eligible
+
+
+class ScreeningPipeline():
+    '''runs screening stages one after another and records what each of them excluded'''
+
+    def __init__(self, stages=None):
+        self.stages = stages if stages is not None else default_stages()
+
+    def run(self, context):
+        mask = np.ones(len(context.tickers), dtype=bool)
+        records = []
+        for stage in self.stages:
+            t_begin = time.perf_counter()
+            with PROFILER.stage(f'screening: {stage.name}'):
+                eligible = stage.apply(context, mask)
+            records.append({'stage': stage.name, 'excluded': int(mask.sum() - eligible.sum()),
+                            'remaining': int(eligible.sum()), 'seconds': time.perf_counter() - t_begin})
+            mask = eligible
+        return mask, pd.DataFrame(records)
+
+
+def default_stages():
+    '''the six steps of the small cap screen'''
+    return [MissingValueStage(), MarketCapStage(), STStage(), ListingAgeStage(), LiquidityStage(), RepresentationStage()]
@@ -1,46 +1,61 @@
-import datetime
+import os
+import sys
 import time
 import warnings
-from collections import Counter, defaultdict
-import pickle
+from collections import defaultdict
 
 import jqdatasdk
 import numpy as np
 import pandas as pd
 from dateutil.relativedelta import relativedelta
-from forex_python.converter import CurrencyRates
 from jqdatasdk import api as jqdata
 from plotly import graph_objects as go
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.datastore import DataStore
+from common.drawdown import Drawdown
+from common.lazypanel import LazyPanel
+from common.metrics import PerformanceMetrics
+from common.profiling import PROFILER, profile
+from common.rolling import get_rolling_metrics
+from common.security_master import SecurityMaster, convert_symbols
+from common.trading_calendar import TradingCalendar
+from fx import FXRates
+from ledger import TradeLedger
+from liquidity import ATVREngine
+from screening import ScreenContext, ScreeningPipeline
+from reference_data import JQDataProvider, LocalProvider
+from results import ResultStore, run_cached
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
 
 class Strategy():
 
-    def __init__(self, df_mcap=None, df_prices=None, df_volume=None, date=None):
+    def __init__(self, df_mcap=None, df_prices=None, df_volume=None, date=None, reference=None, fx=None, atvr=None, calendar=None, securities=None):
         self.df_mcap = df_mcap
         self.df_prices = df_prices
         self.df_volume = df_volume
         self.date = date
+        self.reference = reference or JQDataProvider()
+        self.fx = fx or FXRates()
+        self.atvr = atvr or ATVREngine(df_mcap, df_volume)
+        self.calendar = calendar or TradingCalendar(df_mcap.index)
+        self.securities = securities or SecurityMaster(df_mcap.columns)
+        self.pipeline = ScreeningPipeline()
+        self.screening_report = None
 
     def convert_ticker(self, ticker=None):
-        if 'XSHG' in ticker:
-            ticker = ticker.replace('.XSHG', '.SH')
-        elif 'XSHE' in ticker:
-            ticker = ticker.replace('.XSHE', '.SZ')
-        elif 'SH' in ticker:
-            ticker = ticker.replace('.SH', '.XSHG')
-        elif 'SZ' in ticker:
-            ticker = ticker.replace('.SZ', '.XSHE')
-        return ticker
+        # JoinQuant symbols become Wind tickers and the other way round, use convert_symbols for many
+        vendor = 'wind' if ticker.endswith(('.XSHG', '.XSHE')) else 'jq'
+        return convert_symbols([ticker], vendor)[0]
 
     def next_trading_day(self):
-        date = pd.to_datetime(self.date)
-        open_days = self.df_mcap.index
-        idx = open_days.get_loc(date, method='backfill')
-        return open_days[idx]
+        return self.calendar.next(self.date)
 
     def business_days(self, date):
-        date = pd.to_datetime(date)
-        return self.df_mcap[str(date.year)+'-'+str(date.month)].index
+        # trading days in the month of a date
+        return self.calendar.get_period_days(date, 'M')
 
     def get_earliest_date(self, stock=None):
         date = self.df_mcap[stock].first_valid_index()
@@ -48,186 +63,84 @@ class Strategy():
         return date
 
     def get_atvr(self, stock=None):
-        date = pd.to_datetime(self.date)
-        # make a list of all months in consideration a.k.a. last 12 months
-        months = [date-pd.DateOffset(months=n) for n in range(1, 13)]
-        # what if the stock has only been traded for less than 12 months?
-        earliest = self.get_earliest_date(stock)
-        if months[0] < earliest:
-            m = int((date-earliest).days/30)
-            months = [date-pd.DateOffset(months=n) for n in range(1, m)]
-
-        # for each month, get trading values for each day
-        mtvr = []
-        for month in months:
-            # get a list of all trading days in this month
-            trading_days = self.business_days(month)
-            # compute daily trading values for this month
-            dtv = self.df_volume[stock].loc[trading_days[0]:trading_days[-1]].replace(0, np.nan).dropna()*1000
-            # if there is missing data then skip this stock
-            if len(dtv) == 0:
-                return np.nan
-            # get the median
-            med = np.median(dtv)
-            # get monthly traded value for this month
-            mtv = med * len(dtv)
-            # get the market cap at the end of this month
-            last_day = dtv.index[-1]
-            mkt_cap = df_mcap.at[last_day, stock]*10000
-            # compute the monthly traded value ratio for each month
-            mtvr.append(mtv/mkt_cap)
-        # finally, compute the average traded value ratio
-        atvr = np.mean(mtvr)*12
-        return atvr
+        # the engine computes the ATVR of all stocks for every month in one pass
+        return self.atvr.get_atvr_on(self.date)[stock]
 
+    @profile('industry categorization')
     def categorize_industries(self, stocks=[]):
         date = pd.to_datetime(self.date)
-        stocks = [self.convert_ticker(stock) for stock in stocks]
-        industries = jqdata.get_industry(stocks, date)
+        ids = self.securities.add(stocks)
+        industries = self.reference.get_industries(list(self.securities.to_jq(ids)), date)
+        tickers = dict(zip(self.securities.to_jq(ids), self.securities.to_wind(ids)))
         d = defaultdict(list)
         # get industry of a stock and add to defultdict
-        for stock in stocks:
-            try:
-                industry_name = industries[stock]['sw_l1']['industry_name']
-                d[industry_name].append(self.convert_ticker(stock))
-            except KeyError:
-                continue
+        for stock, industry_name in industries.items():
+            d[industry_name].append(tickers[stock])
         return d
 
+    @profile('screening')
     def filter_eligibility(self):
-        date = pd.to_datetime(self.date)
-        # 1st Step: Exclude NaN values
-        na_eligible = [
-            stock for stock in self.df_mcap.columns if not np.isnan(self.df_mcap.at[date, stock])]
-        print(
-            f'\n[Screening...] Excluded {len(self.df_mcap.columns)-len(na_eligible)} companies with missing values.')
-
-        # 2nd Step: Exclude companies with market cap not in $200M-1500M
-        cap_eligible = []
-        c = CurrencyRates()
-        try:
-            rate = c.get_rate('USD', 'CNY', date)
-        except ConnectionError:
-            print(f'[Connecting...] Fetching exchange rate on {date.date()}.')
-            time.sleep(10)
-        min = rate*200000000
-        max = rate*1500000000
-
-        for stock in na_eligible:
-            if min <= self.df_mcap.at[date, stock]*10000 <= max:
-                cap_eligible.append(self.convert_ticker(stock))
-        print(
-            f'[Screening...] Excluded {len(na_eligible)-len(cap_eligible)} companies with market cap smaller than $200M or larger than $1500M.')
-
-        # 3rd Step: Exclude companies labeled ST or ST*
-        st_status = jqdata.get_extras(
-            'is_st', cap_eligible, start_date=date, end_date=date)
-        st_eligible = [
-            self.convert_ticker(stock) for stock in st_status.columns if not st_status.at[date, stock]]
-        print(
-            f'[Screening...] Excluded {len(cap_eligible)-len(st_eligible)} companies labeled ST or ST* by regulators.')
-
-        # 4th Step: Exclude companies with less than 6 months of trading history
-        length_eligible = []
-        for stock in st_eligible:
-            start_date = self.get_earliest_date(stock)
-            if date - start_date > datetime.timedelta(days=180):
-                length_eligible.append(stock)
-        print(
-            f'[Screening...] Excluded {len(st_eligible)-len(length_eligible)} companies with less than 6 months of trading history.')
-
-        # 5th Step: Exclude companies that fail liquidity screening
-        liquidity_eligible = []
-        dict_atvr = {}
-        for stock in st_eligible:
-            atvr = self.get_atvr(stock)
-            dict_atvr[stock] = atvr
-        atvr_values = list(dict_atvr.values())
-        # drop NaN values
-        atvr_values = [v for v in atvr_values if not np.isnan(v)]
-        threshold = np.percentile(atvr_values, 20)
-        # criteria 1: average traded value ratio >= 5%
-        # criteria 2: belong to the top 80% of the ATVR values in universe
-        for k, v in dict_atvr.items():
-            if v >= 0.05 and v >= threshold:
-                liquidity_eligible.append(k)
-        print(
-            f'[Screening...] Excluded {len(length_eligible)-len(liquidity_eligible)} companies with inadequate liquidity.')
-
-        # 6th Step: Adjust target market representation
-        representation_eligible = []
-        industry_dict = self.categorize_industries(liquidity_eligible)
-        full_industry_dict = self.categorize_industries(na_eligible)
-        for industry in industry_dict.keys():
-            # rank stocks within industry by descending ATVR
-            industry_stocks = [
-                stock for stock in industry_dict[industry] if not np.isnan(dict_atvr[stock])]
-            industry_stocks = sorted(
-                industry_stocks, key=lambda x: dict_atvr[x], reverse=True)
-            # full market cap
-            industry_mkt_cap = sum([df_mcap.at[self.date, stock] * 10000
-                                    for stock in full_industry_dict[industry]])
-            # the cut-off market representation is 40%
-            industry_threshold = industry_mkt_cap * 0.4
-            # select stocks until market_cap reaches threshold
-            industry_eligible = []
-            # if there is only one stock within the industry, this stock is included
-            if len(industry_dict[industry]) == 1:
-                industry_eligible.append(industry_dict[industry][0])
-            else:
-                current_cap = 0
-                idx = 0
-                # print(f'{industry} threshold: ', industry_threshold)
-                while current_cap <= industry_threshold and idx < len(industry_stocks):
-                    current_cap += self.df_mcap.at[date,
-                                                   industry_stocks[idx]] * 10000
-                    try:
-                        industry_eligible.append(industry_stocks[idx])
-                        idx += 1
-                    except IndexError:
-                        print(idx, len(industry_stocks))
-
-                # print(industry, idx, len(industry_stocks))
-
-            representation_eligible += industry_eligible
-        print(
-            f'[Screening...] Excluded {len(liquidity_eligible)-len(representation_eligible)} companies for representativeness.')
-
-        return representation_eligible
+        # each step narrows down a boolean mask over all tickers, see screening.py
+        context = ScreenContext(self.date, self.df_mcap, self.reference, self.fx, self.atvr, self.securities)
+        mask, self.screening_report = self.pipeline.run(context)
+        return list(self.df_mcap.columns[mask])
 
 
 class Portfolio():
+    # holdings are share arrays aligned to the columns of the price panel
+    __slots__ = ('tickers', 'idx', 'shares', 'cash', 'df_prices')
 
     def __init__(self, stocks=None, cash=0, df_prices=None):
-        self.stocks = stocks
+        stocks = stocks or {}
+        self.tickers = np.array(list(stocks.keys()), dtype=object)
+        self.shares = np.array(list(stocks.values()), dtype=np.int64)
+        self.idx = df_prices.columns.get_indexer(self.tickers) if df_prices is not None else None
+        # a missing ticker would read the last column of the panel instead
+        if self.idx is not None and (self.idx < 0).any():
+            raise KeyError(f'No prices stored for tickers: {list(self.tickers[self.idx < 0])}')
         self.cash = cash
         self.df_prices = df_prices
 
-    def get_stock_liquidation(self, date=None):
-        agg_stock_value = 0
-        sell = []
-
-        for stock, shares in self.stocks.items():
-            price = self.df_prices.at[date, stock]
-            stock_value = price * shares
-            # was this stock suspended for trading?
-            if np.isnan(self.df_prices.at[date, stock]):
-                # when was this stock last traded?
-                last_traded = self.df_prices[stock].last_valid_index()
-                self.cash += self.df_prices.at[last_traded, stock]
-                sell.append(stock)
-            else:
-                agg_stock_value += stock_value
-
-        for stock in sell:
-            del self.stocks[stock]
+    @property
+    def stocks(self):
+        return dict(zip(self.tickers, self.shares.tolist()))
+
+    def get_last_traded_prices(self, date=None):
+        # price of each holding on a date, suspended stocks are valued at their last traded price
+        pos = self.df_prices.index.get_loc(pd.to_datetime(date))
+        values = self.df_prices.values
+        prices = values[pos, self.idx].astype(float)
+        suspended = np.flatnonzero(np.isnan(prices))
+        if len(suspended):
+            history = values[:pos+1, self.idx[suspended]]
+            traded = ~np.isnan(history)
+            last = pos - traded[::-1].argmax(axis=0)
+            prices[suspended] = np.where(traded.any(axis=0), history[last, np.arange(len(suspended))], 0)
+        return prices
 
-        return agg_stock_value
+    def get_stock_liquidation(self, date=None):
+        if len(self.tickers) == 0:
+            return 0
+        return self.get_last_traded_prices(date) @ self.shares
 
     def get_net_liquidation(self, date=None):
         net_liquidation = self.get_stock_liquidation(date) + self.cash
         return net_liquidation
 
+    def get_net_liquidation_series(self, dates=None):
+        # values the portfolio on many dates at once
+        dates = pd.DatetimeIndex(dates)
+        if len(self.tickers) == 0:
+            return np.full(len(dates), float(self.cash))
+        start, end = self.df_prices.index.get_loc(dates[0]), self.df_prices.index.get_loc(dates[-1])
+        # only the held columns over the segment are read, the price panel may be loaded lazily
+        values = self.df_prices.values[start:end+1, self.idx].astype(float)
+        # stocks suspended on the first date carry their last traded price into the segment
+        values[0] = self.get_last_traded_prices(dates[0])
+        history = pd.DataFrame(values, index=self.df_prices.index[start:end+1])
+        last_traded = np.nan_to_num(history.ffill().loc[dates].values)
+        return last_traded @ self.shares + self.cash
+
     def print_portfolio(self):
         for stock, shares in self.stocks.items():
             print(stock, shares)
@@ -235,24 +148,57 @@ class Portfolio():
 
 class BackTest():
 
-    def __init__(self, start_date='2010-01-01', end_date='2020-12-31', init_funds=10000000, commission=0, log=[], data=None):
+    def __init__(self, start_date='2010-01-01', end_date='2020-12-31', init_funds=10000000, commission=0, log=None, data=None, reference=None, fx=None):
         self.start_date = start_date
         self.end_date = end_date
         self.init_funds = init_funds
         self.commission = commission
-        self.log = log
+        # a fresh log per backtest, a shared default list would collect every run's portfolios
+        self.log = log if log is not None else []
         self.data = data
+        self.reference = reference or JQDataProvider()
+        self.fx = fx or FXRates()
+        self.atvr = None
+        self.pipeline = ScreeningPipeline()
+        self.screening = {}
+        self.nav = None
+        self.ledger = None
+        self.calendar = None
+        self.securities = None
+
+    def get_calendar(self):
+        # built from the panel index once and shared with every rebalance
+        if self.calendar is None:
+            self.calendar = TradingCalendar(self.data[0].index)
+        return self.calendar
 
     def next_trading_day(self, date=None):
-        date = pd.to_datetime(date)
-        open_days = self.data[0].index
-        idx = open_days.get_loc(date, method='backfill')
-        return open_days[idx]
+        return self.get_calendar().next(date)
 
+    def get_securities(self):
+        # every ticker of the panels gets its ID once, for all rebalances
+        if self.securities is None:
+            self.securities = SecurityMaster(self.data[0].columns.union(self.data[1].columns, sort=False))
+        return self.securities
+
+    @profile('portfolio construction')
     def get_portfolio(self, funds_available=None, cash_ratio=0, date=None, weight='equal'):
-        strategy = Strategy(self.data[0], self.data[1], self.data[2], date)
+        if isinstance(self.data[0], LazyPanel):
+            # only the tickers alive on the date and the months ATVR looks back on are loaded
+            data = self.get_window(date)
+            atvr = ATVREngine(data[0], data[2])
+        else:
+            # ATVR is computed for every month once and shared by all rebalances
+            if self.atvr is None:
+                self.atvr = ATVREngine(self.data[0], self.data[2])
+            data, atvr = self.data, self.atvr
+        strategy = Strategy(data[0], data[1], data[2], date, self.reference, self.fx, atvr,
+                            self.get_calendar(), self.get_securities())
+        strategy.pipeline = self.pipeline
         composition = strategy.filter_eligibility()
-        df_mcap, df_prices = self.data[0], self.data[1]
+        # per-stage exclusion counts and timings of this rebalance
+        self.screening[date] = strategy.screening_report
+        df_mcap, df_prices = data[0], data[1]
         funds_investable = funds_available*(1-cash_ratio)
         cash = funds_available*cash_ratio
         portfolio_stocks = {}
@@ -289,22 +235,28 @@ class BackTest():
                 cash += (amount - price*shares)
 
         portfolio = Portfolio(stocks=portfolio_stocks,
-                              cash=cash, df_prices=df_prices)
+                              cash=cash, df_prices=self.data[1])
         return portfolio
 
+    def get_window(self, date=None, n_month=12):
+        # the panels a rebalance screens on, cut to the ATVR look-back and the tickers with a market cap
+        date = pd.to_datetime(date)
+        alive = self.data[0].get_row(date).dropna().index
+        start = (pd.Period(date, freq='M') - n_month).start_time
+        return tuple(panel.get(start, date, alive) for panel in self.data)
+
+    def get_rebalance_dates(self):
+        # the log is appended in date order, so its dates are already sorted
+        return pd.DatetimeIndex([transaction[0] for transaction in self.log])
+
+    def get_holding_index(self, dates=None):
+        # at each date, which portfolio am I holding? dates before the first rebalance use the first one
+        idx = self.get_rebalance_dates().searchsorted(pd.DatetimeIndex(dates), side='right') - 1
+        return np.maximum(idx, 0)
+
     def calculate_pl(self, date=None):
         date = pd.to_datetime(date)
-        i = 0
-        flag = 0
-        # at the current date, which portfolio am I holding?
-        for i in range(len(self.log)):
-            try:
-                if self.log[i][0] <= date < self.log[i+1][0]:
-                    flag = i
-                else:
-                    i += 1
-            except IndexError:
-                flag = len(self.log) - 1
+        flag = self.get_holding_index([date])[0]
 
         current_portfolio = self.log[flag][1]
         # how much is my holding portfolio's worth?
@@ -314,15 +266,24 @@ class BackTest():
 
         return pl
 
-    def run_backtest(self, freq=6):
+    def run_backtest(self, freq=6, weight='equal', cash_ratio=0, init_weight='cap'):
         start_date = pd.to_datetime(self.start_date)
         end_date = pd.to_datetime(self.end_date)
-        now = self.next_trading_day(start_date)
-
-        # intitial portfolio
-        p = self.get_portfolio(
-            funds_available=self.init_funds, date=now, weight='cap')
-        self.log.append((now, p))
+        if self.log:
+            # a restored log is resumed after its last rebalance
+            now, p = self.log[-1]
+            self.ledger = TradeLedger.from_log(self.log, self.data[1], self.commission)
+        else:
+            now = self.next_trading_day(start_date)
+            self.ledger = TradeLedger(self.data[1], self.commission)
+
+            # intitial portfolio
+            p = self.get_portfolio(
+                funds_available=self.init_funds, cash_ratio=cash_ratio, date=now, weight=init_weight)
+            # commission on the trades is paid out of the portfolio's cash
+            p.cash -= self.ledger.get_commission(now, p)
+            self.ledger.append(now, p)
+            self.log.append((now, p))
 
         while now <= end_date-pd.DateOffset(months=6):
             # next date for reblancing portfolio
@@ -333,9 +294,47 @@ class BackTest():
             net_liquidation = p.get_net_liquidation(date=now)
             # make a new portfolio
             old_p = p
-            p = self.get_portfolio(funds_available=net_liquidation, date=now)
+            p = self.get_portfolio(funds_available=net_liquidation, cash_ratio=cash_ratio, date=now, weight=weight)
+            p.cash -= self.ledger.get_commission(now, p)
+            self.ledger.append(now, p)
             self.log.append((now, p))
 
+    def restore_log(self, holdings=None):
+        # rebuilds the log from stored (date, stocks, cash) records
+        self.log = [(date, Portfolio(stocks=stocks, cash=cash, df_prices=self.data[1]))
+                    for date, stocks, cash in holdings]
+        self.ledger = None
+        self.nav = None
+
+    def get_ledger(self):
+        # a loaded log has no ledger yet, rebuild it from the portfolios
+        if self.ledger is None or len(self.ledger.dates) != len(self.log):
+            self.ledger = TradeLedger.from_log(self.log, self.data[1], self.commission)
+        return self.ledger
+
+    @profile('NAV')
+    def get_nav(self, dates=None):
+        # value each holding period with its own portfolio and join the pieces together
+        dates = pd.DatetimeIndex(dates)
+        holding = self.get_holding_index(dates)
+        nav = np.empty(len(dates))
+        for i in np.unique(holding):
+            segment = holding == i
+            nav[segment] = self.log[i][1].get_net_liquidation_series(dates[segment])
+        return pd.Series(nav, index=dates)
+
+    def extend_nav(self, dates=None):
+        # only values dates after the last one already valued
+        dates = pd.DatetimeIndex(dates)
+        if self.nav is None or len(self.nav) == 0:
+            self.nav = self.get_nav(dates)
+            return self.nav
+        new = dates[dates > self.nav.index[-1]]
+        if len(new) == 0:
+            return self.nav
+        self.nav = pd.concat([self.nav, self.get_nav(new)])
+        return self.nav
+
     def get_daily_change(self, stocks=[]):
         day_change = [0]
         for i in range(1, len(stocks)):
@@ -345,17 +344,18 @@ class BackTest():
             day_change.append(change)
         return day_change
 
+    @profile('performance')
     def generate_performance(self):
-        df_performance = jqdata.get_price(
+        df_performance = self.reference.get_price(
             '000300.XSHG', start_date=self.start_date, end_date=self.end_date)
         df_performance = df_performance[['close']].rename(
             columns={'close': 'CSI 300'})
         # convert to percentage
-        df_performance = df_performance / df_performance['CSI 300'][0]*100
+        df_performance = df_performance / df_performance['CSI 300'].iloc[0]*100
         # get performance of portfolio
         dates = df_performance.index
-        portfolio_performance = [self.calculate_pl(date) for date in dates]
-        df_performance['Small Cap'] = portfolio_performance
+        nav = self.extend_nav(dates)
+        df_performance['Small Cap'] = (nav.loc[dates] / self.init_funds * 100).values
 
         # df_performance.to_csv('performance.csv', index_label='date')
         return df_performance
@@ -380,56 +380,56 @@ class BackTest():
                                  100, line={'dash': 'dot'}, name='Excess Return'))
         fig.show()
 
-    def show_metrics(self, df_performance):
+    @profile('metrics')
+    def get_metrics(self, df_performance):
+        # series statistics come from one pass over the daily returns, the rest from the log
         metrics = Metrics(self.log, df_performance)
         start_date = df_performance.index[0]
         end_date = df_performance.index[-1]
-        csi_300 = df_performance['CSI 300']
-        small_cap = df_performance['Small Cap']
+        result = PerformanceMetrics(df_performance[['Small Cap']], df_performance['CSI 300']).to_dict()
+
+        result['Start Date'] = start_date
+        result['End Date'] = end_date
+        result['Win Rate'] = metrics.get_win_rate(start_date, end_date)
+        result['Profit-Loss Ratio'] = metrics.get_pl_ratio(start_date, end_date)
+        result['Turnover Ratio'] = self.get_ledger().get_turnover_ratio(start_date, end_date)
+        result['Trading Cost'] = self.get_ledger().get_trades()['cost'].sum()
+        result['Average Holding Days'] = self.get_ledger().get_holding_periods()['days'].mean()
+        return result
 
-        cum_r = metrics.get_cumulative_return(small_cap, start_date, end_date)
-        ann_r = metrics.get_annualized_return(small_cap, start_date, end_date)
-        ann_ex_r = metrics.get_annualized_excess_return(
-            small_cap, csi_300, start_date, end_date)
-        max_dd = metrics.get_max_drawdown(small_cap, start_date, end_date)
-        vo = metrics.get_strategy_volatility(small_cap, start_date, end_date)
-        sharpe = metrics.get_sharpe_ratio(small_cap, start_date, end_date)
-        ir = metrics.get_information_ratio(
-            small_cap, csi_300, start_date, end_date)
-        beta = metrics.get_beta(small_cap, csi_300, start_date, end_date)
-        alpha = metrics.get_alpha(small_cap, csi_300, start_date, end_date)
-        win_r = metrics.get_win_rate(start_date, end_date)
-        win_r_d = metrics.get_daily_win_rate(
-            small_cap, csi_300, start_date, end_date)
-        pl = metrics.get_pl_ratio(start_date, end_date)
-        to_r = metrics.get_turnover_ratio(start_date, end_date, self.data[1])
-        trk_err = metrics.get_tracking_error(
-            small_cap, csi_300, start_date, end_date)
+    def get_rolling_metrics(self, df_performance, windows=(60, 120, 250)):
+        # rolling volatility, Sharpe, beta, tracking error and IR against the CSI 300
+        return get_rolling_metrics(df_performance['Small Cap'], df_performance['CSI 300'], windows)
+
+    def show_metrics(self, df_performance):
+        m = self.get_metrics(df_performance)
 
         print('\n============================================')
         print('| Key Metrics ')
         print('============================================')
-        print(f'| Start Date:        {start_date.date()}')
-        print(f'| End Date:          {end_date.date()}')
+        print(f'| Start Date:        {m["Start Date"].date()}')
+        print(f'| End Date:          {m["End Date"].date()}')
         print('============================================')
-        print(f'| Cumulative Return: {round(cum_r*100, 2)}%')
-        print(f'| Annualized Return: {round(ann_r*100, 2)}%')
-        print(f'| Annualized Excess: {round(ann_ex_r*100, 2)}%')
-        print(f'| Maximum Drawdown:  {round(max_dd*100, 2)}%')
+        print(f'| Cumulative Return: {round(m["Cumulative Return"]*100, 2)}%')
+        print(f'| Annualized Return: {round(m["Annualized Return"]*100, 2)}%')
+        print(f'| Annualized Excess: {round(m["Annualized Excess"]*100, 2)}%')
+        print(f'| Maximum Drawdown:  {round(m["Maximum Drawdown"]*100, 2)}%')
         print('============================================')
-        print(f'| Information Ratio: {round(ir, 3)}')
-        print(f'| Sharpe Ratio:      {round(sharpe, 3)}')
-        print(f'| Volatility:        {round(vo, 3)}')
+        print(f'| Information Ratio: {round(m["Information Ratio"], 3)}')
+        print(f'| Sharpe Ratio:      {round(m["Sharpe Ratio"], 3)}')
+        print(f'| Volatility:        {round(m["Volatility"], 3)}')
         print('============================================')
-        print(f'| Alpha:             {round(alpha, 3)}')
-        print(f'| Beta:              {round(beta, 3)}')
+        print(f'| Alpha:             {round(m["Alpha"], 3)}')
+        print(f'| Beta:              {round(m["Beta"], 3)}')
         print('============================================')
-        print(f'| Win Rate:          {round(win_r*100, 2)}%')
-        print(f'| Daily Win Rate:    {round(win_r_d*100, 2)}%')
-        print(f'| Profit-Loss Ratio: {round(pl, 1)} : 1')
+        print(f'| Win Rate:          {round(m["Win Rate"]*100, 2)}%')
+        print(f'| Daily Win Rate:    {round(m["Daily Win Rate"]*100, 2)}%')
+        print(f'| Profit-Loss Ratio: {round(m["Profit-Loss Ratio"], 1)} : 1')
         print('============================================')
-        print(f'| Turnover Ratio:    {round(to_r*100, 2)}%')
-        print(f'| Tracking Error:    {round(trk_err*100, 2)}%')
+        print(f'| Turnover Ratio:    {round(m["Turnover Ratio"]*100, 2)}%')
+        print(f'| Tracking Error:    {round(m["Tracking Error"]*100, 2)}%')
+        print(f'| Trading Cost:      {round(m["Trading Cost"], 2)}')
+        print(f'| Avg Holding Days:  {round(m["Average Holding Days"], 1)}')
         print('============================================')
 
 
@@ -440,14 +440,9 @@ class Metrics():
         self.df_performance = df_performance
 
     def get_daily_return(self, stocks=[]):
-        day_change = [0]
-        for i in range(1, len(stocks)):
-            yesterday = stocks[i-1]
-            today = stocks[i]
-            change = round((today-yesterday)/yesterday, 4)
-            day_change.append(change)
-
-        day_change = pd.Series(data=day_change, index=stocks.index)
+        # full precision, the first day counts as no change
+        day_change = stocks / stocks.shift(1) - 1
+        day_change.iloc[0] = 0
         return day_change
 
     def get_cumulative_return(self, time_series, start_date, end_date):
@@ -497,15 +492,8 @@ class Metrics():
 
     def get_max_drawdown(self, time_series, start_date, end_date):
         time_series = time_series.loc[start_date:end_date]
-        start_date, end_date = time_series.index[0], time_series.index[-1]
-        max_drawdown = 0
-        # for each day, get the lowest price in the period after
-        for day in time_series.index:
-            day_price = time_series[day]
-            lowest = time_series.loc[day:].min()
-            drawdown = (day_price-lowest) / day_price
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
+        # the largest fall from a running peak, found in one pass
+        max_drawdown = Drawdown(time_series).get_max_drawdown()
 
         max_drawdown = round(max_drawdown, 4)
         return max_drawdown
@@ -646,55 +634,21 @@ class Metrics():
         return excess_return
 
     def get_transaction_history(self):
-        days = [transaction[0] for transaction in self.log]
-        # first add in the initial portfolio
-        history = [{days[0]:{'buy': {}, 'sell': {}}}]
-        # loop over the second to last portfolios
-        for i in range(1, len(self.log)):
-            curr_portfolio = self.log[i][1].stocks
-            prev_portfolio = self.log[i-1][1].stocks
-            buy = Counter(curr_portfolio) - Counter(prev_portfolio)
-            sell = Counter(prev_portfolio) - Counter(curr_portfolio)
-            buy, sell = dict(buy), dict(sell)
-
-            key = self.log[i][0]
-            value = {'buy': buy, 'sell': sell}
-
-            history.append({key: value})
-
+        df_prices = self.log[0][1].df_prices
+        ledger = TradeLedger.from_log(self.log, df_prices)
+        deltas = ledger.get_deltas()
+        tickers = df_prices.columns
+        # the initial portfolio has no transactions
+        history = [{ledger.dates[0]: {'buy': {}, 'sell': {}}}]
+        for date, delta in zip(ledger.dates[1:], deltas[1:]):
+            buy, sell = np.flatnonzero(delta > 0), np.flatnonzero(delta < 0)
+            history.append({date: {'buy': dict(zip(tickers[buy], delta[buy].tolist())),
+                                   'sell': dict(zip(tickers[sell], (-delta[sell]).tolist()))}})
         return history
 
     def get_turnover_ratio(self, start_date, end_date, df_prices):
-        start_date, end_date = pd.to_datetime(
-            start_date), pd.to_datetime(end_date)
-        # trim log to fit within the time period
-        log = [transaction for transaction in self.log if start_date <=
-               transaction[0] <= end_date]
-
-        begin_liquidation = log[0][1].get_net_liquidation(log[0][0])
-        end_liquidation = log[-1][1].get_net_liquidation(log[-1][0])
-        avg_liquidation = (end_liquidation + begin_liquidation) / 2
-        n_years = log[-1][0].year - log[0][0].year
-
-        history = self.get_transaction_history()
-        agg_turnover = 0
-        for i in range(1, len(history)):
-            date = log[i][0]
-            curr_transaction = history[i][date]
-            buy_portfolio = Portfolio(
-                stocks=curr_transaction['buy'], df_prices=df_prices)
-            sell_portfolio = Portfolio(
-                stocks=curr_transaction['sell'], df_prices=df_prices)
-
-            buy_value = buy_portfolio.get_net_liquidation(date)
-            sell_value = sell_portfolio.get_net_liquidation(date)
-            turnover = (buy_value + sell_value) / 2
-            agg_turnover += turnover
-
-        avg_annual_turnover = agg_turnover / n_years
-        avg_turnover_ratio = avg_annual_turnover / avg_liquidation
-
-        return avg_turnover_ratio
+        # trades are matched to their own rebalance dates within the period
+        return TradeLedger.from_log(self.log, df_prices).get_turnover_ratio(start_date, end_date)
 
     def get_tracking_error(self, strategy, benchmark, start_date, end_date):
         ann_ex_r = self.get_annualized_excess_return(
@@ -710,48 +664,38 @@ if __name__ == '__main__':
 
     # load in datasets
     print('[Initilizing...] Loading data.')
-    df_mcap = pd.read_csv('data\\market_cap.csv', parse_dates=[
-        'date']).set_index('date')
-    df_prices = pd.read_csv('data\\price.csv', parse_dates=[
-                            'date']).set_index('date')
-    df_volume = pd.read_csv('data\\volume.csv', parse_dates=[
-                            'date']).set_index('date')
+    store = DataStore(DATA_DIR)
+    # panels are read lazily, by date range and ticker subset
+    df_mcap = store.load_lazy('market_cap')
+    df_prices = store.load_lazy('price')
+    df_volume = store.load_lazy('volume')
     print('[Initilizing...] Data successfully loaded.\n')
 
-    bypass = True
-    save_model = False
-    if not bypass:
-        t_begin = time.time()
+    offline = True
+    t_begin = time.time()
 
-        warnings.filterwarnings('ignore')
+    warnings.filterwarnings('ignore')
+    if offline:
+        # reference data comes from the local store, run reference_data.py to prefetch it
+        reference = LocalProvider()
+    else:
         # log into account
         jqdatasdk.auth('18070536824', '536824')
         queries = jqdata.get_query_count(field='spare')
         print(f'[Logging in...] {queries} queries left today.')
+        reference = LocalProvider(source=JQDataProvider())
 
-        # run backtest
-        bt = BackTest(start_date='2010-01-01', end_date='2020-12-31',
-                      data=(df_mcap, df_prices, df_volume))
-        bt.run_backtest()
-        performance = bt.generate_performance()
+    # run backtest, unchanged runs are served from the result store and extended runs only compute the tail
+    bt = BackTest(start_date='2010-01-01', end_date='2020-12-31',
+                  data=(df_mcap, df_prices, df_volume), reference=reference)
+    performance = run_cached(bt, ResultStore())
 
-        t_end = time.time()
-        print(f'\n[Completed] Backtest completed in {round((t_end - t_begin), 3)} seconds.')
-
-        if save_model == True:
-            with open('model.dat', "wb") as f:
-                pickle.dump((bt.log, performance), f)
-            print('[Saving...] Model saved to folder.')
-
-    else:
-        with open('model.dat', 'rb') as f:
-            model = pickle.load(f)
-            f.close()
-        log = model[0]
-        performance = model[1]
-
-        bt = BackTest(start_date='2010-01-01', end_date='2020-12-31', log=log,
-                      data=(df_mcap, df_prices, df_volume))
+    t_end = time.time()
+    print(f'\n[Completed] Backtest completed in {round((t_end - t_begin), 3)} seconds.')
 
     bt.plot_performance(performance)
     bt.show_metrics(performance)
+
+    if PROFILER.enabled:
+        # set PROFILE_TRACE to a file path to record a trace of the run
+        print(PROFILER.summary())
@@ -0,0 +1,149 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'Small Cap'))
+sys.path.append(os.path.join(ROOT, 'Industry Momentum + CAPE'))
+from benchmarks.synthetic import (SCALES, ConstantFX, make_benchmark, make_industries, make_industry_tables,
+                                  make_stock_panels)
+from cape import CapePanel
+from liquidity import ATVREngine
+from momentum import MomentumPanel
+from reference_data import FakeProvider
+from small_cap import BackTest, Metrics, Portfolio, Strategy
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def measure(func, repeat=5):
+    '''median and fastest wall time of a call, in seconds
+
+    Like timeit, each sample loops the call until it lasts at least 0.2 seconds, so
+    sub-millisecond paths are not timed off a single call.
+    '''
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = np.array(timer.repeat(repeat, number)) / number
+    return {'median': float(np.median(times)), 'min': float(np.min(times)), 'repeat': repeat, 'number': number}
+
+
+def make_log(df_mcap, df_prices, n_stocks=100, seed=0):
+    # semi-annual portfolios of random listed stocks, the shape run_backtest produces
+    rng = np.random.default_rng(seed)
+    log = []
+    dates = df_prices.index[::125]
+    for date in dates:
+        listed = df_prices.columns[df_prices.loc[date].notna().values]
+        stocks = rng.choice(listed, min(n_stocks, len(listed)), replace=False)
+        log.append((date, Portfolio(stocks={s: int(rng.integers(100, 10000)) for s in stocks}, cash=1e5, df_prices=df_prices)))
+    return log
+
+
+def run_suite(n_tickers=500, n_years=5, n_sectors=11, repeat=5, seed=0):
+    '''times every hot path on synthetic data of one scale'''
+    df_mcap, df_prices, df_volume = make_stock_panels(n_tickers, n_years, seed=seed)
+    industry_index, earnings, total_returns = make_industry_tables(n_sectors, max(n_years, 20), seed=seed)
+    benchmark = make_benchmark(df_prices.index, seed)
+    reference = FakeProvider(industries=make_industries(df_prices.columns, n_sectors, seed),
+                             prices={'000300.XSHG': benchmark})
+    fx = ConstantFX()
+    atvr = ATVREngine(df_mcap, df_volume)
+    # a rebalance date with a full year of ATVR history behind it
+    date = df_mcap.index[-130]
+
+    bt = BackTest(start_date=df_prices.index[0], end_date=df_prices.index[-1], init_funds=1e8, log=make_log(df_mcap, df_prices),
+                  data=(df_mcap, df_prices, df_volume), reference=reference, fx=fx)
+    nav = pd.Series(np.exp(np.cumsum(np.random.default_rng(seed).normal(0, 0.01, len(df_prices)))), index=df_prices.index)
+    stock = df_mcap.columns[0]
+
+    def generate_performance():
+        bt.nav = None
+        bt.generate_performance()
+
+    benchmarks = {
+        'filter_eligibility': lambda: Strategy(df_mcap, df_prices, df_volume, date, reference, fx, atvr).filter_eligibility(),
+        'get_atvr (all months)': lambda: ATVREngine(df_mcap, df_volume).get_atvr(),
+        'get_atvr (one stock)': lambda: Strategy(df_mcap, df_prices, df_volume, date, reference, fx, atvr).get_atvr(stock),
+        'calculate_pl': lambda: bt.calculate_pl(date),
+        'generate_performance': generate_performance,
+        'get_max_drawdown': lambda: Metrics().get_max_drawdown(nav, nav.index[0], nav.index[-1]),
+        'get_relative_cape_rank': lambda: CapePanel(earnings, total_returns).get_relative_cape_rank(40),
+        'get_mom_rank': lambda: MomentumPanel(industry_index).get_mom_rank(6),
+    }
+    results = []
+    for name, func in benchmarks.items():
+        results.append({'name': name, **measure(func, repeat)})
+        print(f'[Benchmarking...] {name}: {round(results[-1]["median"]*1000, 3)} ms')
+    return results
+
+
+def save_results(results, label, scale):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, label + '.json')
+    report = {
+        'label': label,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'pandas': pd.__version__, 'machine': platform.machine()},
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def compare(results, baseline, tolerance=0.2, min_delta=0.001):
+    '''fastest times against a saved baseline, a ratio above 1 + tolerance is a regression
+
+    A slowdown under min_delta seconds is left out as timer noise, whatever its ratio.
+    '''
+    with open(baseline) as f:
+        base = pd.DataFrame(json.load(f)['results']).set_index('name')['min']
+    current = pd.DataFrame(results).set_index('name')['min']
+    df = pd.DataFrame({'baseline': base, 'current': current})
+    df['ratio'] = df['current'] / df['baseline']
+    df['regression'] = (df['ratio'] > 1 + tolerance) & (df['current'] - df['baseline'] > min_delta)
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='times the hot paths of both strategies on synthetic data')
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--tickers', type=int, default=None)
+    parser.add_argument('--years', type=int, default=None)
+    parser.add_argument('--sectors', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', default=None, help='label to store the results under benchmarks/results')
+    parser.add_argument('--compare', default=None, help='a saved results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-delta', type=float, default=0.001, help='slowdowns below this many seconds are ignored')
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key, value in (('n_tickers', args.tickers), ('n_years', args.years), ('n_sectors', args.sectors)):
+        if value is not None:
+            scale[key] = value
+    print(f'[Initilizing...] Synthetic data with {scale}.')
+
+    results = run_suite(**scale, repeat=args.repeat)
+    if args.save:
+        print(f'[Saving...] Results saved to {save_results(results, args.save, scale)}.')
+    if args.compare:
+        with open(args.compare) as f:
+            if json.load(f)['scale'] != scale:
+                print('[Warning...] The baseline was measured at a different scale.')
+        df = compare(results, args.compare, args.tolerance, args.min_delta)
+        print(df)
+        if df['regression'].any():
+            print(f'[Warning...] Regressions in {list(df.index[df["regression"]])}.')
+            sys.exit(1)
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from common.security_master import convert_symbols
+
+WIND_I_SECTORS = ['Energy', 'Materials', 'Industrials', 'Consumer Discretionary', 'Consumer Staples', 'Health Care',
+                  'Financials', 'Information Technology', 'Communication Services', 'Utilities', 'Real Estate']
+
+SCALES = {
+    'small': {'n_tickers': 500, 'n_years': 5, 'n_sectors': 11},
+    'medium': {'n_tickers': 2000, 'n_years': 15, 'n_sectors': 26},
+    'large': {'n_tickers': 10000, 'n_years': 30, 'n_sectors': 26},
+}
+
+
+def get_tickers(n_tickers):
+    # Wind style tickers, split between the Shenzhen and Shanghai exchanges
+    return [f'{i:06d}.SZ' if i % 2 else f'{600000 + i:06d}.SH' for i in range(n_tickers)]
+
+
+def get_sectors(n_sectors):
+    if n_sectors == len(WIND_I_SECTORS):
+        return list(WIND_I_SECTORS)
+    return [f'Sector {i}' for i in range(n_sectors)]
+
+
+def make_stock_panels(n_tickers=500, n_years=5, end_date='2020-12-31', seed=0):
+    '''market cap (10k CNY), price (CNY) and traded value (1k CNY) panels with listings and suspensions'''
+    rng = np.random.default_rng(seed)
+    end_date = pd.to_datetime(end_date)
+    dates = pd.bdate_range(end_date - pd.DateOffset(years=n_years), end_date)
+    tickers = get_tickers(n_tickers)
+    n_days = len(dates)
+
+    returns = rng.normal(0.0003, 0.025, (n_days, n_tickers))
+    price = rng.uniform(3, 60, n_tickers) * np.exp(np.cumsum(returns, axis=0))
+    shares = rng.lognormal(np.log(2e4), 1.0, n_tickers)
+    mcap = price * shares
+    volume = mcap * rng.lognormal(np.log(0.05), 0.8, n_tickers) * rng.lognormal(0, 0.5, (n_days, n_tickers))
+
+    # a fifth of the companies list during the period
+    listing = np.where(rng.random(n_tickers) < 0.2, rng.integers(0, n_days, n_tickers), 0)
+    unlisted = np.arange(n_days)[:, None] < listing
+    # suspensions: no price and no volume, the market cap is still reported
+    suspended = rng.random((n_days, n_tickers)) < 0.01
+    price[unlisted | suspended] = np.nan
+    volume[unlisted | suspended] = np.nan
+    mcap[unlisted] = np.nan
+
+    frame = lambda values: pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='date'), columns=tickers)
+    return frame(mcap), frame(price), frame(volume)
+
+
+def make_industries(tickers, n_sectors=11, seed=0):
+    '''maps the JoinQuant symbol of every ticker to a sector'''
+    rng = np.random.default_rng(seed)
+    sectors = get_sectors(n_sectors)
+    symbols = convert_symbols(tickers, 'jq')
+    return dict(zip(symbols, rng.choice(sectors, len(symbols))))
+
+
+def make_industry_tables(n_sectors=11, n_years=20, end_date='2020-12-31', seed=0):
+    '''WIND style daily industry index levels with quarterly earnings and total returns'''
+    rng = np.random.default_rng(seed)
+    end_date = pd.to_datetime(end_date)
+    dates = pd.bdate_range(end_date - pd.DateOffset(years=n_years), end_date)
+    sectors = get_sectors(n_sectors)
+
+    levels = 1000 * np.exp(np.cumsum(rng.normal(0.0002, 0.015, (len(dates), n_sectors)), axis=0))
+    industry_index = pd.DataFrame(levels, index=pd.DatetimeIndex(dates, name='Date'), columns=sectors)
+
+    # quarters begin on their first trading day, as in the preprocessed WIND tables
+    quarters = industry_index.groupby(industry_index.index.to_period('Q')).head(1)
+    total_returns = quarters * np.exp(np.cumsum(rng.normal(0.005, 0.01, quarters.shape), axis=0))
+    earnings = quarters * rng.lognormal(np.log(0.02), 0.3, quarters.shape)
+    return industry_index, earnings, total_returns
+
+
+def make_benchmark(dates, seed=0):
+    '''CSI 300 closes in the layout JoinQuant get_price returns'''
+    rng = np.random.default_rng(seed)
+    close = 3000 * np.exp(np.cumsum(rng.normal(0.0002, 0.013, len(dates))))
+    return pd.DataFrame({'close': close}, index=pd.DatetimeIndex(dates, name='date'))
+
+
+class ConstantFX():
+    '''a fixed USD/CNY rate, the same interface as fx.FXRates'''
+
+    def __init__(self, rate=6.5):
+        self.rate = rate
+
+    def get_rate(self, date):
+        return self.rate
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from common.lazypanel import LazyPanel
+from common.profiling import profile
+
+
+def fingerprint_panel(df, end_date, chunk_size=250) -> str:
+    # hashes the panel up to a date, so appending new dates keeps older fingerprints valid
+    end = df.index.searchsorted(pd.to_datetime(end_date), side='right')
+    h = hashlib.sha1()
+    h.update(json.dumps(list(map(str, df.columns))).encode())
+    h.update(np.ascontiguousarray(df.index.values[:end].astype('datetime64[D]')).tobytes())
+    # row chunks keep lazily loaded panels from being read whole
+    for start in range(0, end, chunk_size):
+        h.update(np.ascontiguousarray(df.values[start:min(start+chunk_size, end), :], dtype=float).tobytes())
+    return h.hexdigest()
+
+
+class DataStore():
+    '''caches date-indexed CSV panels as memory-mapped NumPy arrays
+
+    Every panel is converted once into a directory holding the values, the date index
+    and the column (ticker) dictionary. The conversion is redone whenever the source
+    CSV changes, otherwise loads are zero-copy views onto the files on disk.
+    '''
+
+    def __init__(self, source_dir, store_dir=None) -> None:
+        self.source_dir = source_dir
+        self.store_dir = store_dir or os.path.join(source_dir, '.store')
+        self._frames = {}
+
+    def source_path(self, name) -> str:
+        return os.path.join(self.source_dir, name + '.csv')
+
+    def panel_dir(self, name) -> str:
+        return os.path.join(self.store_dir, name)
+
+    def fingerprint(self, name) -> dict:
+        '''identifies a version of the source CSV by its size and modification time'''
+        stat = os.stat(self.source_path(name))
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def is_stale(self, name) -> bool:
+        manifest = os.path.join(self.panel_dir(name), 'manifest.json')
+        if not os.path.exists(manifest):
+            return True
+        with open(manifest) as f:
+            return json.load(f) != self.fingerprint(name)
+
+    def convert(self, name, index_col='date') -> None:
+        '''parses the source CSV and writes it into the columnar store'''
+        df = pd.read_csv(self.source_path(name), index_col=[index_col], parse_dates=[index_col],
+                         encoding='utf-8-sig')
+        path = self.panel_dir(name)
+        os.makedirs(path, exist_ok=True)
+
+        np.save(os.path.join(path, 'values.npy'), df.to_numpy(dtype=float))
+        np.save(os.path.join(path, 'index.npy'), df.index.values)
+        with open(os.path.join(path, 'columns.json'), 'w') as f:
+            json.dump({'index_name': df.index.name, 'columns': list(df.columns)}, f)
+        # the manifest is written last so an interrupted conversion is redone next time
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(self.fingerprint(name), f)
+
+    @profile('data load')
+    def load(self, name, index_col='date') -> pd.DataFrame:
+        '''returns a panel backed by memory-mapped arrays, converting the CSV first if needed'''
+        if name in self._frames and not self.is_stale(name):
+            return self._frames[name]
+        if self.is_stale(name):
+            self.convert(name, index_col)
+        return self.open(name)
+
+    def open(self, name) -> pd.DataFrame:
+        '''memory-maps a panel already in the store, without checking or converting its CSV'''
+        path = self.panel_dir(name)
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        index = np.load(os.path.join(path, 'index.npy'))
+        with open(os.path.join(path, 'columns.json')) as f:
+            meta = json.load(f)
+
+        index = pd.DatetimeIndex(index, name=meta['index_name'])
+        df = pd.DataFrame(values, index=index, columns=meta['columns'], copy=False)
+        self._frames[name] = df
+        return df
+
+    def convert_blocks(self, name, block_size=256) -> None:
+        '''splits the stored values into files of block_size columns each, for lazy loading'''
+        path = self.panel_dir(name)
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        blocks = os.path.join(path, 'blocks')
+        os.makedirs(blocks, exist_ok=True)
+        for k, start in enumerate(range(0, values.shape[1], block_size)):
+            np.save(os.path.join(blocks, f'{k}.npy'), np.ascontiguousarray(values[:, start:start+block_size]))
+        with open(os.path.join(blocks, 'manifest.json'), 'w') as f:
+            json.dump({**self.fingerprint(name), 'block_size': block_size}, f)
+
+    @profile('data load')
+    def load_lazy(self, name, index_col='date', block_size=256, chunk_size=250, max_tiles=512) -> LazyPanel:
+        '''returns a panel that reads date ranges and ticker subsets from column blocks on demand'''
+        if self.is_stale(name):
+            self.convert(name, index_col)
+        path = self.panel_dir(name)
+        manifest = os.path.join(path, 'blocks', 'manifest.json')
+        expected = {**self.fingerprint(name), 'block_size': block_size}
+        stale = True
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                stale = json.load(f) != expected
+        if stale:
+            self.convert_blocks(name, block_size)
+
+        index = np.load(os.path.join(path, 'index.npy'))
+        with open(os.path.join(path, 'columns.json')) as f:
+            meta = json.load(f)
+        n_blocks = -(-len(meta['columns']) // block_size)
+        blocks = [np.load(os.path.join(path, 'blocks', f'{k}.npy'), mmap_mode='r') for k in range(n_blocks)]
+        return LazyPanel(blocks, pd.DatetimeIndex(index, name=meta['index_name']), pd.Index(meta['columns']),
+                         block_size, chunk_size, max_tiles)
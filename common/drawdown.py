@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+
+class Drawdown():
+    '''drawdown analytics of a value series, all derived from one running-peak pass'''
+
+    def __init__(self, time_series) -> None:
+        self.time_series = time_series.dropna()
+        values = self.time_series.values
+        self.peak = np.maximum.accumulate(values)
+        # fraction lost since the running peak, 0 when at a new high
+        self.underwater = 1 - values / self.peak
+
+    def get_underwater(self) -> pd.Series:
+        '''the underwater curve, i.e. the drawdown on every day'''
+        return pd.Series(self.underwater, index=self.time_series.index)
+
+    def get_max_drawdown(self) -> float:
+        if len(self.underwater) == 0:
+            return 0
+        return float(self.underwater.max())
+
+    def get_episodes(self) -> pd.DataFrame:
+        '''every drawdown episode with its peak, trough and recovery dates, deepest first'''
+        index = self.time_series.index
+        at_peak = self.underwater == 0
+        # each episode shares the id of the peak it falls from
+        episode = np.cumsum(at_peak)
+        df = pd.DataFrame({'episode': episode, 'drawdown': self.underwater, 'row': np.arange(len(index))})
+
+        grouped = df.groupby('episode')
+        start = grouped['row'].min()
+        trough = df.loc[grouped['drawdown'].idxmax(), 'row'].values
+        depth = grouped['drawdown'].max()
+        # an episode recovers on the first row of the next one
+        recovery = start.shift(-1)
+
+        episodes = pd.DataFrame({
+            'drawdown': depth.values,
+            'peak': index[start.values],
+            'trough': index[trough],
+            'recovery': [index[int(r)] if pd.notna(r) else pd.NaT for r in recovery.values],
+            'duration': (recovery.fillna(len(index)-1) - start).values.astype(int),
+        })
+        episodes = episodes[episodes['drawdown'] > 0]
+        return episodes.sort_values('drawdown', ascending=False, kind='mergesort').reset_index(drop=True)
+
+    def get_top_episodes(self, n=5) -> pd.DataFrame:
+        return self.get_episodes().head(n)
+
+    def get_max_drawdown_info(self) -> dict:
+        '''the maximum drawdown with its peak, trough and recovery dates and duration in periods'''
+        episodes = self.get_episodes()
+        if len(episodes) == 0:
+            return {'drawdown': 0, 'peak': pd.NaT, 'trough': pd.NaT, 'recovery': pd.NaT, 'duration': 0}
+        return episodes.iloc[0].to_dict()
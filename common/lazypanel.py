@@ -0,0 +1,112 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class LazyValues():
+    '''array-like view of a lazy panel, indexing with [rows, columns] reads only those tiles
+
+    Each axis is indexed independently, so two position arrays select their outer product.
+    '''
+
+    def __init__(self, panel) -> None:
+        self.panel = panel
+
+    @property
+    def shape(self):
+        return self.panel.shape
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        return self.panel.take(rows, cols)
+
+
+class LazyLoc():
+    '''label access, a date gives one row as a Series and a date slice gives a DataFrame'''
+
+    def __init__(self, panel) -> None:
+        self.panel = panel
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.panel.get(key.start, key.stop)
+        pos = self.panel.index.get_loc(pd.to_datetime(key))
+        return pd.Series(self.panel.take(pos, slice(None)), index=self.panel.columns, name=self.panel.index[pos])
+
+
+class LazyPanel():
+    '''a date x ticker panel stored in column blocks and read tile by tile on demand
+
+    Each block file holds block_size tickers over all dates. Reads are split into tiles of
+    chunk_size dates within a block, and the most recently used tiles are kept in memory,
+    so a request for a date range and a ticker subset only loads the tiles covering them.
+    '''
+
+    def __init__(self, blocks, index, columns, block_size=256, chunk_size=250, max_tiles=512) -> None:
+        self.blocks = blocks
+        self.index = index
+        self.columns = columns
+        self.block_size = block_size
+        self.chunk_size = chunk_size
+        self.max_tiles = max_tiles
+        self.shape = (len(index), len(columns))
+        self.values = LazyValues(self)
+        self.loc = LazyLoc(self)
+        self._tiles = OrderedDict()
+
+    def get_tile(self, block, chunk) -> np.ndarray:
+        key = (block, chunk)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+        tile = np.array(self.blocks[block][chunk*self.chunk_size:(chunk+1)*self.chunk_size])
+        self._tiles[key] = tile
+        if len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def take(self, rows, cols) -> np.ndarray:
+        '''values at row and column positions, scalars drop their axis as with NumPy indexing'''
+        r = np.arange(self.shape[0])[rows]
+        c = np.arange(self.shape[1])[cols]
+        out = np.empty((np.size(r), np.size(c)))
+        r_flat, c_flat = np.atleast_1d(r), np.atleast_1d(c)
+
+        row_chunks = r_flat // self.chunk_size
+        col_blocks = c_flat // self.block_size
+        for block in np.unique(col_blocks):
+            col_sel = np.flatnonzero(col_blocks == block)
+            col_offset = c_flat[col_sel] - block*self.block_size
+            for chunk in np.unique(row_chunks):
+                row_sel = np.flatnonzero(row_chunks == chunk)
+                tile = self.get_tile(block, chunk)
+                out[np.ix_(row_sel, col_sel)] = tile[np.ix_(r_flat[row_sel] - chunk*self.chunk_size, col_offset)]
+
+        if np.ndim(r) == 0 and np.ndim(c) == 0:
+            return out[0, 0]
+        if np.ndim(r) == 0:
+            return out[0]
+        if np.ndim(c) == 0:
+            return out[:, 0]
+        return out
+
+    def get(self, start_date=None, end_date=None, tickers=None) -> pd.DataFrame:
+        '''a DataFrame of a date range and a ticker subset, unknown tickers are all NaN'''
+        rows = self.index.slice_indexer(pd.to_datetime(start_date) if start_date is not None else None,
+                                        pd.to_datetime(end_date) if end_date is not None else None)
+        if tickers is None:
+            return pd.DataFrame(self.take(rows, slice(None)), index=self.index[rows], columns=self.columns)
+        tickers = pd.Index(tickers)
+        cols = self.columns.get_indexer(tickers)
+        values = np.full((len(self.index[rows]), len(tickers)), np.nan)
+        known = cols >= 0
+        values[:, known] = self.take(rows, cols[known])
+        return pd.DataFrame(values, index=self.index[rows], columns=tickers)
+
+    def get_row(self, date, tickers=None) -> pd.Series:
+        row = self.get(date, date, tickers)
+        return row.iloc[0]
+
+    def clear(self) -> None:
+        self._tiles.clear()
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+class PerformanceMetrics():
+    '''scores one or many strategy value series against a benchmark from a single return matrix
+
+    Daily returns are computed once at full precision. Every statistic is then a column-wise
+    NumPy reduction over that matrix, so many strategies cost about as much as one.
+    '''
+
+    def __init__(self, strategy, benchmark, risk_free=0.04, periods=250) -> None:
+        if isinstance(strategy, pd.Series):
+            strategy = strategy.to_frame(strategy.name or 'strategy')
+        strategy, benchmark = strategy.align(benchmark, join='inner', axis=0)
+        self.strategy = strategy
+        self.benchmark = benchmark
+        self.risk_free = risk_free
+        self.periods = periods
+
+        self.values = strategy.values.astype(float)
+        self.bench_values = benchmark.values.astype(float)
+        # the first day has no return and counts as 0, as Metrics.get_daily_return does
+        self.returns = np.vstack([np.zeros((1, self.values.shape[1])), self.values[1:] / self.values[:-1] - 1])
+        self.bench_returns = np.r_[0, self.bench_values[1:] / self.bench_values[:-1] - 1]
+
+    def annualize(self, cum_rtn) -> np.ndarray:
+        return np.power(1 + cum_rtn, self.periods / len(self.values)) - 1
+
+    def compute(self) -> pd.DataFrame:
+        '''all metrics, one row per metric and one column per strategy'''
+        r, rb = self.returns, self.bench_returns[:, None]
+        excess = r - rb
+
+        cum_rtn = self.values[-1] / self.values[0] - 1
+        ann_rtn = self.annualize(cum_rtn)
+        bench_ann_rtn = self.annualize(self.bench_values[-1] / self.bench_values[0] - 1)
+        ann_ex_rtn = ann_rtn - bench_ann_rtn
+
+        peak = np.maximum.accumulate(self.values, axis=0)
+        max_dd = (1 - self.values / peak).max(axis=0)
+
+        vo = r.std(axis=0) * np.sqrt(self.periods)
+        tracking_error = excess.std(axis=0) * np.sqrt(self.periods)
+        # covariance and variance with one degree of freedom, as np.cov does
+        n = len(r)
+        cov = ((r - r.mean(axis=0)) * (rb - rb.mean())).sum(axis=0) / (n - 1)
+        beta = cov / rb.var(ddof=1)
+        capm = self.risk_free + beta * (bench_ann_rtn - self.risk_free)
+
+        metrics = {
+            'Cumulative Return': cum_rtn,
+            'Annualized Return': ann_rtn,
+            'Annualized Excess': ann_ex_rtn,
+            'Maximum Drawdown': max_dd,
+            'Information Ratio': ann_ex_rtn / tracking_error,
+            'Sharpe Ratio': (ann_rtn - self.risk_free) / vo,
+            'Volatility': vo,
+            'Alpha': ann_rtn - capm,
+            'Beta': beta,
+            'Daily Win Rate': (excess > 0).mean(axis=0),
+            'Tracking Error': tracking_error,
+        }
+        return pd.DataFrame(metrics, index=self.strategy.columns).T
+
+    def to_dict(self, column=None) -> dict:
+        '''metrics of one strategy, the first one by default'''
+        df = self.compute()
+        column = df.columns[0] if column is None else column
+        return df[column].to_dict()
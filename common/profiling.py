@@ -0,0 +1,111 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class Profiler():
+    '''records wall time, call counts and memory of named stages as trace events
+
+    Disabled by default. Instrumented code only checks the enabled flag, so leaving the
+    stages in place costs one attribute lookup per call. Setting the PROFILE_TRACE
+    environment variable to a file path enables the profiler and writes a Chrome trace
+    there when the process exits.
+    '''
+
+    def __init__(self, enabled=False, memory=True) -> None:
+        self.enabled = enabled
+        self.memory = memory
+        self.events = []
+        self.t_origin = time.perf_counter_ns()
+        # the highest traced memory seen inside each open stage, outermost first
+        self._peaks = []
+
+    def enable(self, memory=True) -> None:
+        self.enabled = True
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def clear(self) -> None:
+        self.events = []
+        self.t_origin = time.perf_counter_ns()
+
+    @contextmanager
+    def stage(self, name, **args):
+        '''times a block of code as one event, nested stages show up nested in the trace'''
+        if not self.enabled:
+            yield
+            return
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            mem_begin, mem_peak = tracemalloc.get_traced_memory()
+            # the peak is process-wide, so the enclosing stage keeps what was reached so far
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], mem_peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(mem_begin)
+        t_begin = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            t_end = time.perf_counter_ns()
+            if memory:
+                mem_end, mem_peak = tracemalloc.get_traced_memory()
+                mem_peak = max(self._peaks.pop(), mem_peak)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], mem_peak)
+                # the peak is reported above the memory traced when the stage began
+                args = {**args, 'memory': mem_end - mem_begin, 'peak': mem_peak - mem_begin}
+            self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                                'ts': (t_begin - self.t_origin) / 1000, 'dur': (t_end - t_begin) / 1000,
+                                'args': args})
+
+    def summary(self) -> pd.DataFrame:
+        '''calls, total and mean seconds and the largest memory change of every stage'''
+        if not self.events:
+            return pd.DataFrame(columns=['calls', 'seconds', 'mean', 'memory'])
+        df = pd.DataFrame([{'stage': e['name'], 'seconds': e['dur'] / 1e6, 'memory': e['args'].get('memory')}
+                           for e in self.events])
+        summary = df.groupby('stage').agg(calls=('seconds', 'size'), seconds=('seconds', 'sum'),
+                                          mean=('seconds', 'mean'), memory=('memory', 'max'))
+        return summary.sort_values('seconds', ascending=False)
+
+    def save(self, path) -> None:
+        '''writes the events in the Chrome trace format, open it in chrome://tracing or Perfetto'''
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+PROFILER = Profiler()
+
+
+def profile(name=None):
+    '''decorator recording every call of a function as a stage of the global profiler'''
+    def decorator(func):
+        stage = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if os.environ.get('PROFILE_TRACE'):
+    import atexit
+    PROFILER.enable()
+    atexit.register(lambda: PROFILER.save(os.environ['PROFILE_TRACE']))
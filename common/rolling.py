@@ -0,0 +1,86 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class RollingMetrics():
+    '''rolling risk metrics over a fixed window, updated in O(1) for every new day
+
+    Running means, second moments and the co-moment of strategy and benchmark returns
+    are kept with Welford's updates, adding the newest day and removing the oldest one.
+    '''
+
+    def __init__(self, window=60, risk_free=0.04, periods=250) -> None:
+        self.window = window
+        self.risk_free = risk_free
+        self.periods = periods
+        self.obs = deque()
+        self.n = 0
+        self.mean_s = self.mean_b = self.mean_e = 0.0
+        self.m2_s = self.m2_b = self.m2_e = 0.0
+        self.c_sb = 0.0
+
+    def add(self, r_s, r_b) -> None:
+        e = r_s - r_b
+        self.n += 1
+        d_s, d_b, d_e = r_s - self.mean_s, r_b - self.mean_b, e - self.mean_e
+        self.mean_s += d_s / self.n
+        self.mean_b += d_b / self.n
+        self.mean_e += d_e / self.n
+        self.m2_s += d_s * (r_s - self.mean_s)
+        self.m2_b += d_b * (r_b - self.mean_b)
+        self.m2_e += d_e * (e - self.mean_e)
+        self.c_sb += d_s * (r_b - self.mean_b)
+
+    def remove(self, r_s, r_b) -> None:
+        e = r_s - r_b
+        if self.n == 1:
+            self.__init__(self.window, self.risk_free, self.periods)
+            return
+        self.n -= 1
+        # undo the add: the co-moment uses the benchmark mean before it is rolled back
+        mean_s = self.mean_s - (r_s - self.mean_s) / self.n
+        mean_b = self.mean_b - (r_b - self.mean_b) / self.n
+        mean_e = self.mean_e - (e - self.mean_e) / self.n
+        self.m2_s -= (r_s - mean_s) * (r_s - self.mean_s)
+        self.m2_b -= (r_b - mean_b) * (r_b - self.mean_b)
+        self.m2_e -= (e - mean_e) * (e - self.mean_e)
+        self.c_sb -= (r_s - mean_s) * (r_b - self.mean_b)
+        self.mean_s, self.mean_b, self.mean_e = mean_s, mean_b, mean_e
+
+    def update(self, r_s, r_b) -> dict:
+        '''adds one day of strategy and benchmark returns and returns the metrics of the window'''
+        self.obs.append((r_s, r_b))
+        self.add(r_s, r_b)
+        if len(self.obs) > self.window:
+            self.remove(*self.obs.popleft())
+        return self.get_metrics()
+
+    def get_metrics(self) -> dict:
+        if self.n < self.window:
+            return dict.fromkeys(['Volatility', 'Sharpe Ratio', 'Beta', 'Tracking Error', 'Information Ratio'], np.nan)
+        vo = np.sqrt(max(self.m2_s, 0) / self.n * self.periods)
+        tracking_error = np.sqrt(max(self.m2_e, 0) / self.n * self.periods)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'Volatility': vo,
+                'Sharpe Ratio': np.divide(self.mean_s * self.periods - self.risk_free, vo),
+                'Beta': np.divide(self.c_sb, self.m2_b),
+                'Tracking Error': tracking_error,
+                'Information Ratio': np.divide(self.mean_e * self.periods, tracking_error),
+            }
+
+
+def get_rolling_metrics(strategy, benchmark, windows=(60, 120, 250), risk_free=0.04, periods=250) -> pd.DataFrame:
+    '''rolling metrics of a value series against a benchmark, columns are (window, metric)'''
+    strategy, benchmark = strategy.align(benchmark, join='inner')
+    r_s = (strategy / strategy.shift(1) - 1).values[1:]
+    r_b = (benchmark / benchmark.shift(1) - 1).values[1:]
+
+    frames = {}
+    for window in windows:
+        rolling = RollingMetrics(window, risk_free, periods)
+        rows = [rolling.update(s, b) for s, b in zip(r_s, r_b)]
+        frames[window] = pd.DataFrame(rows, index=strategy.index[1:])
+    return pd.concat(frames, axis=1, names=['window', 'metric'])
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# exchange of every vendor suffix, and the suffix each vendor uses for an exchange
+SUFFIXES = {'SH': 'SH', 'XSHG': 'SH', 'SZ': 'SZ', 'XSHE': 'SZ'}
+VENDORS = {
+    'wind': {'SH': '.SH', 'SZ': '.SZ'},
+    'jq': {'SH': '.XSHG', 'SZ': '.XSHE'},
+    'plain': {'SH': '', 'SZ': ''},
+}
+# exchange of a plain stock code, by its first digit
+PREFIXES = {'6': 'SH', '9': 'SH', '0': 'SZ', '2': 'SZ', '3': 'SZ'}
+
+
+def parse_symbols(symbols):
+    '''splits Wind, JoinQuant or plain symbols into code and exchange arrays'''
+    symbols = pd.Series(pd.Index(symbols).astype(str).str.upper())
+    if symbols.empty:
+        return np.array([], dtype=object), np.array([], dtype=object)
+    parts = symbols.str.split('.', n=1, expand=True).reindex(columns=[0, 1])
+    codes, suffixes = parts[0], parts[1]
+    exchanges = suffixes.map(SUFFIXES)
+    # a plain code carries its exchange in its first digit
+    plain = suffixes.isna()
+    exchanges[plain] = codes[plain].str[0].map(PREFIXES)
+    if exchanges.isna().any():
+        raise ValueError(f'unknown symbols: {list(symbols[exchanges.isna()][:5])}')
+    return codes.values.astype(object), exchanges.values.astype(object)
+
+
+def convert_symbols(symbols, vendor='jq') -> pd.Index:
+    '''converts symbols of any vendor into the format of one vendor, in bulk'''
+    codes, exchanges = parse_symbols(symbols)
+    suffix = pd.Series(exchanges).map(VENDORS[vendor]).values
+    return pd.Index(codes + suffix)
+
+
+class SecurityMaster():
+    '''assigns every security a dense integer ID and keeps its symbol for each vendor
+
+    IDs follow the order securities are added in. Symbols of any vendor resolve to IDs
+    with one hash lookup per batch, and IDs map back to any vendor by array indexing.
+    '''
+
+    def __init__(self, symbols=()) -> None:
+        self.codes = np.array([], dtype=object)
+        self.exchanges = np.array([], dtype=object)
+        self.symbols = {vendor: np.array([], dtype=object) for vendor in VENDORS}
+        self._lookup = pd.Index([], dtype=object)
+        if len(symbols):
+            self.add(symbols)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def add(self, symbols) -> np.ndarray:
+        '''registers new securities and returns the IDs of all the given ones'''
+        codes, exchanges = parse_symbols(symbols)
+        keys = pd.Index(codes + '.' + exchanges)
+        new = ~keys.isin(self._lookup) & ~keys.duplicated()
+        if new.any():
+            self.codes = np.r_[self.codes, codes[new]]
+            self.exchanges = np.r_[self.exchanges, exchanges[new]]
+            for vendor, suffixes in VENDORS.items():
+                self.symbols[vendor] = np.r_[self.symbols[vendor], codes[new] + pd.Series(exchanges[new]).map(suffixes).values]
+            self._lookup = pd.Index(self.codes + '.' + self.exchanges)
+        return self._lookup.get_indexer(keys)
+
+    def get_ids(self, symbols) -> np.ndarray:
+        '''IDs of symbols of any vendor, -1 for unknown securities'''
+        codes, exchanges = parse_symbols(symbols)
+        return self._lookup.get_indexer(codes + '.' + exchanges)
+
+    def get_symbols(self, ids=None, vendor='wind') -> pd.Index:
+        symbols = self.symbols[vendor]
+        return pd.Index(symbols if ids is None else symbols[np.asarray(ids)])
+
+    def to_wind(self, ids=None) -> pd.Index:
+        return self.get_symbols(ids, 'wind')
+
+    def to_jq(self, ids=None) -> pd.Index:
+        return self.get_symbols(ids, 'jq')
+
+    def to_plain(self, ids=None) -> pd.Index:
+        return self.get_symbols(ids, 'plain')
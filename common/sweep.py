@@ -0,0 +1,45 @@
+import itertools
+import multiprocessing
+import os
+import time
+import traceback
+
+import pandas as pd
+
+
+def expand_grid(grid) -> list:
+    '''every combination of a dict of parameter lists, in a stable order'''
+    names = list(grid)
+    values = [grid[name] if isinstance(grid[name], (list, tuple)) else [grid[name]] for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def _call(args) -> dict:
+    # runs one grid point in a worker, a failed run is recorded instead of stopping the sweep
+    run, params = args
+    t_begin = time.perf_counter()
+    try:
+        metrics, error = run(**params), None
+    except Exception:
+        metrics, error = {}, traceback.format_exc(limit=3)
+    return {**params, **metrics, 'seconds': time.perf_counter() - t_begin, 'error': error}
+
+
+def run_sweep(run, grid, processes=None, initializer=None, initargs=()) -> pd.DataFrame:
+    '''runs a function over a parameter grid on a process pool, one row of metrics per run
+
+    `run` must be a module-level function taking the grid parameters as keywords and returning
+    a dict of metrics. Panels should be opened in `initializer` from memory-mapped stores, so
+    every worker maps the same pages instead of receiving a pickled copy.
+    '''
+    points = expand_grid(grid) if isinstance(grid, dict) else list(grid)
+    processes = min(processes or os.cpu_count() or 1, len(points))
+
+    if processes <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        rows = [_call((run, params)) for params in points]
+    else:
+        with multiprocessing.Pool(processes, initializer, initargs) as pool:
+            rows = list(pool.imap(_call, [(run, params) for params in points], chunksize=1))
+    return pd.DataFrame(rows)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# months, quarters and half-years, by their length in months
+FREQS = {'M': 1, 'Q': 3, 'H': 6}
+
+
+class TradingCalendar():
+    '''the trading days of a panel as a sorted datetime64 array, built once and shared
+
+    Every lookup is a binary search over the array. The first trading day of each month,
+    quarter and half-year is found once when the calendar is built.
+    '''
+
+    def __init__(self, days) -> None:
+        self.days = np.unique(pd.DatetimeIndex(days).values.astype('datetime64[ns]'))
+        self.index = pd.DatetimeIndex(self.days)
+        self._starts = {}
+        self._keys = {}
+        for freq in FREQS:
+            keys = self.get_period_keys(self.days, freq)
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            self._starts[freq], self._keys[freq] = starts, keys[starts]
+
+    def get_period_keys(self, days, freq='M') -> np.ndarray:
+        # number of the month, quarter or half-year of each day, counted from 1970
+        return days.astype('datetime64[M]').astype(np.int64) // FREQS[freq]
+
+    def _lookup(self, dates, side):
+        scalar = not isinstance(dates, (pd.Index, np.ndarray, list, tuple, pd.Series))
+        values = pd.DatetimeIndex([dates] if scalar else dates).values.astype('datetime64[ns]')
+        return scalar, np.searchsorted(self.days, values, side=side)
+
+    def _to_days(self, scalar, pos, message):
+        if np.any(pos < 0) or np.any(pos >= len(self.days)):
+            raise KeyError(message)
+        return self.index[pos[0]] if scalar else self.index[pos]
+
+    def next(self, dates):
+        '''the first trading day on or after a date, or each of many dates'''
+        scalar, pos = self._lookup(dates, 'left')
+        return self._to_days(scalar, pos, 'date after the last trading day')
+
+    def previous(self, dates):
+        '''the last trading day on or before a date, or each of many dates'''
+        scalar, pos = self._lookup(dates, 'right')
+        return self._to_days(scalar, pos - 1, 'date before the first trading day')
+
+    def get_position(self, dates):
+        '''positions of the last trading day on or before each date, -1 before the first one'''
+        scalar, pos = self._lookup(dates, 'right')
+        return pos[0] - 1 if scalar else pos - 1
+
+    def get_period_bounds(self, freq='M'):
+        '''positions of the first and last trading day of every month (M), quarter (Q) or half-year (H)'''
+        starts = self._starts[freq]
+        return starts, np.r_[starts[1:], len(self.days)] - 1
+
+    def get_period_firsts(self, freq='M') -> pd.DatetimeIndex:
+        return self.index[self.get_period_bounds(freq)[0]]
+
+    def get_period_lasts(self, freq='M') -> pd.DatetimeIndex:
+        return self.index[self.get_period_bounds(freq)[1]]
+
+    def get_period_days(self, date, freq='M') -> pd.DatetimeIndex:
+        '''the trading days in the month, quarter or half-year of a date'''
+        key = self.get_period_keys(np.array([np.datetime64(pd.to_datetime(date), 'ns')]), freq)[0]
+        i = np.searchsorted(self._keys[freq], key)
+        if i == len(self._keys[freq]) or self._keys[freq][i] != key:
+            return self.index[:0]
+        starts, ends = self.get_period_bounds(freq)
+        return self.index[starts[i]:ends[i]+1]